@@ -1,9 +1,22 @@
 from django.contrib import admin
+from django.db.models import F
 from .models import Listing, User, Bid, Comment, Category, Watchlist
 
 # Register your models here.
 
-admin.site.register(Listing)
+class ListingAdmin(admin.ModelAdmin):
+
+    def save_model(self, request, obj, form, change):
+        # Edits change the listing card, so give it a new cache version;
+        # in the UPDATE, so a bid's bump made meanwhile is not written over
+        if change:
+            obj.version = F("version") + 1
+        super().save_model(request, obj, form, change)
+        if change:
+            obj.refresh_from_db(fields=["version"])
+
+
+admin.site.register(Listing, ListingAdmin)
 admin.site.register(User)
 admin.site.register(Bid)
 admin.site.register(Comment)
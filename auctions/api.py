@@ -0,0 +1,212 @@
+"""Read-only JSON API over listings, bids and categories.
+
+Every list is paginated by keyset cursor (`after`) like the HTML feeds, and
+`fields=title,price` trims a listing down to the columns a consumer needs.
+`export` streams every listing as NDJSON in constant memory and `changes`
+lets a consumer sync incrementally, deletes included, from the last
+position it has seen.
+"""
+import datetime
+import functools
+import json
+
+from django.conf import settings
+from django.core.serializers.json import DjangoJSONEncoder
+from django.http import JsonResponse, StreamingHttpResponse
+from django.shortcuts import get_object_or_404
+from django.utils import timezone
+
+from .bidding import bid_history
+from .models import Category, Listing, ListingChange
+from .pagination import decode_cursor, encode_cursor, keyset_page
+from .routers import read_only
+
+# pylint: disable=no-member
+
+# Rows fetched per round trip by the NDJSON export
+EXPORT_CHUNK_SIZE = 2000
+
+# name -> (column for .only(), related model to join or None, value)
+LISTING_FIELDS = {
+    "id": ("id", None, lambda item: item.id),
+    "title": ("title", None, lambda item: item.title),
+    "description": ("description", None, lambda item: item.description),
+    "price": ("price", None, lambda item: item.price),
+    "actual_bid": ("actual_bid", None, lambda item: item.actual_bid),
+    "bid_count": ("bid_count", None, lambda item: item.bid_count),
+    "on_sell": ("on_sell", None, lambda item: item.on_sell),
+    "date": ("date", None, lambda item: item.date),
+    "ends_at": ("ends_at", None, lambda item: item.ends_at),
+    "updated_at": ("updated_at", None, lambda item: item.updated_at),
+    "image": ("image", None, lambda item: item.image.url if item.image else None),
+    "category": ("category__name", "category", lambda item: item.category.name),
+    "owner": ("owner__username", "owner", lambda item: item.owner.username),
+    "leading_bidder": (
+        "leading_bidder__username", "leading_bidder",
+        lambda item: item.leading_bidder.username if item.leading_bidder_id else None,
+    ),
+}
+
+
+class BadRequest(Exception):
+    pass
+
+
+def error(message, status=400):
+    return JsonResponse({"error": message}, status=status)
+
+
+def selected_fields(request):
+    requested = request.GET.get("fields")
+    if not requested:
+        return list(LISTING_FIELDS)
+    names = [name.strip() for name in requested.split(",") if name.strip()]
+    unknown = [name for name in names if name not in LISTING_FIELDS]
+    if unknown:
+        raise BadRequest(f"Unknown fields: {', '.join(unknown)}")
+    return names
+
+
+def listings(fields, queryset=None):
+    """Listings loading only the columns and joins `fields` need."""
+    if queryset is None:
+        queryset = Listing.objects.all()
+    related = [LISTING_FIELDS[name][1] for name in fields if LISTING_FIELDS[name][1]]
+    # date and id are what the cursors are built from
+    columns = {"id", "date"} | {LISTING_FIELDS[name][0] for name in fields}
+    if related:
+        # select_related() without arguments would follow every foreign key
+        queryset = queryset.select_related(*related)
+    return queryset.only(*columns)
+
+
+def serialize(item, fields):
+    return {name: LISTING_FIELDS[name][2](item) for name in fields}
+
+
+def parse_since(value):
+    try:
+        since = datetime.datetime.fromisoformat(value)
+    except ValueError:
+        raise BadRequest("since must be an ISO 8601 date")
+    if timezone.is_naive(since):
+        since = timezone.make_aware(since, datetime.timezone.utc)
+    return since
+
+
+def api_view(view):
+    # Turns a BadRequest raised while reading the query string into a 400
+    @functools.wraps(view)
+    def wrapper(request, *args, **kwargs):
+        try:
+            return view(request, *args, **kwargs)
+        except BadRequest as reason:
+            return error(str(reason))
+    return wrapper
+
+
+def filtered(request, queryset):
+    category = request.GET.get("category")
+    if category:
+        if not category.isdigit():
+            raise BadRequest("category must be an id")
+        queryset = queryset.filter(category_id=int(category))
+    on_sell = request.GET.get("on_sell")
+    if on_sell is not None:
+        queryset = queryset.filter(on_sell=on_sell.lower() in ("1", "true", "yes"))
+    return queryset
+
+
+@read_only
+@api_view
+def listing_list(request):
+    fields = selected_fields(request)
+    items, next_cursor = keyset_page(listings(fields, filtered(request, Listing.objects.all())), request.GET.get("after"))
+    return JsonResponse({"listings": [serialize(item, fields) for item in items], "next": next_cursor})
+
+
+@read_only
+@api_view
+def listing_detail(request, item_id):
+    fields = selected_fields(request)
+    item = get_object_or_404(listings(fields), pk=item_id)
+    return JsonResponse(serialize(item, fields))
+
+
+@read_only
+@api_view
+def listing_bids(request, item_id):
+    page, next_cursor = bid_history(item_id, request.GET.get("after"))
+    return JsonResponse({
+        "bids": [
+            {"amount": bid.amount, "buyer": bid.buyer.username, "date": bid.date}
+            for bid in page
+        ],
+        "next": next_cursor,
+    })
+
+
+@read_only
+def category_list(request):
+    return JsonResponse({"categories": [
+        {
+            "id": category.id,
+            "name": category.name,
+            "active_count": category.active_count,
+            "total_count": category.total_count,
+            "latest_date": category.latest_date,
+        }
+        for category in Category.objects.all()
+    ]})
+
+
+@read_only
+@api_view
+def changes(request):
+    """Listings changed after a position, in the order the changes committed.
+
+    Start with `since=<ISO date>` (or without, for every listing), then pass
+    the returned `next` back as `after`; `next` is returned even on the last
+    page so a consumer can store it and ask again later. A listing comes
+    as it is now, a deleted one as {"id": ..., "deleted": true}. Paged by
+    the sequence number of each listing's last change (ListingChange): a
+    change that commits later always gets a higher one.
+    """
+    fields = selected_fields(request)
+    size = getattr(settings, "LISTINGS_PAGE_SIZE", 24)
+    log = ListingChange.objects.order_by("seq")
+    cursor = request.GET.get("after")
+    if cursor:
+        position = decode_cursor(cursor, int)
+        if position is None:
+            raise BadRequest("after is not a valid cursor")
+        log = log.filter(seq__gt=position[0])
+    elif request.GET.get("since"):
+        log = log.filter(changed_at__gt=parse_since(request.GET["since"]))
+    entries = list(log[:size + 1])
+    more = len(entries) > size
+    entries = entries[:size]
+    found = listings(fields).in_bulk([entry.listing_id for entry in entries if not entry.deleted])
+    rows = []
+    for entry in entries:
+        item = found.get(entry.listing_id)
+        # Missing though not marked: deleted since the log was read, and
+        # its tombstone is further on
+        rows.append(serialize(item, fields) if item else {"id": entry.listing_id, "deleted": True})
+    if entries:
+        cursor = encode_cursor(entries[-1].seq, entries[-1].listing_id)
+    return JsonResponse({"listings": rows, "next": cursor, "more": more})
+
+
+@read_only
+@api_view
+def export(request):
+    """Every listing as one JSON object per line, streamed."""
+    fields = selected_fields(request)
+    rows = listings(fields, filtered(request, Listing.objects.all())).order_by("id")
+    # The rows are read after the view has returned, pin the connection now
+    rows = rows.using(rows.db).iterator(chunk_size=EXPORT_CHUNK_SIZE)
+    lines = (json.dumps(serialize(item, fields), cls=DjangoJSONEncoder) + "\n" for item in rows)
+    response = StreamingHttpResponse(lines, content_type="application/x-ndjson")
+    response["Content-Disposition"] = 'attachment; filename="listings.ndjson"'
+    return response
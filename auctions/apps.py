@@ -3,3 +3,11 @@ from django.apps import AppConfig
 
 class AuctionsConfig(AppConfig):
     name = 'auctions'
+
+    def ready(self):
+        from django.db.backends.signals import connection_created
+        from . import auth, categories, metrics, pagecache
+        auth.connect_signals(self.get_model('User'))
+        categories.connect_signals()
+        pagecache.connect_signals()
+        connection_created.connect(metrics.install_query_hook, dispatch_uid="auctions.metrics.queries")
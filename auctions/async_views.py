@@ -0,0 +1,83 @@
+"""Async versions of the read-heavy pages, served by the ASGI deployment.
+
+Django 3.1 has no async ORM, and under ASGI it runs every sync view on one
+shared thread, so a page waiting on SQLite or a template holds up all the
+others. These views hand the page (its queries and its rendering, which
+reads lazily from the database and the fragment cache) to a pool of
+ASYNC_VIEW_THREADS threads instead, where several run at once while the
+event loop keeps taking connections. Each pool thread has its own database
+connections, checked and recycled around every page like a request
+thread's.
+
+commerce/asgi.py routes the pages here through commerce/asgi_urls.py; the
+sync views stay what WSGI serves.
+"""
+import asyncio
+import contextvars
+import functools
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.db import close_old_connections
+
+from . import views
+
+_executor = None
+_executor_lock = threading.Lock()
+
+
+def executor():
+    global _executor
+    with _executor_lock:
+        if _executor is None:
+            _executor = ThreadPoolExecutor(
+                max_workers=getattr(settings, "ASYNC_VIEW_THREADS", 8), thread_name_prefix="pages")
+        return _executor
+
+
+def _page(view, request, *args, **kwargs):
+    close_old_connections()
+    try:
+        return view(request, *args, **kwargs)
+    finally:
+        close_old_connections()
+
+
+async def render_in_pool(view, request, *args, **kwargs):
+    """Run the sync `view` on a pool thread, in the request's context.
+
+    The context carries the request being measured (metrics.current) and
+    the @read_only routing flag to the thread.
+    """
+    context = contextvars.copy_context()
+    call = functools.partial(context.run, _page, view, request, *args, **kwargs)
+    return await asyncio.get_running_loop().run_in_executor(executor(), call)
+
+
+async def index(request):
+    return await render_in_pool(views.index, request)
+
+
+async def all(request):
+    return await render_in_pool(views.all, request)
+
+
+async def details(request, item_id):
+    if request.method != "GET":
+        # Bids go where Django would send the sync view
+        return await sync_to_async(views.details)(request, item_id)
+    return await render_in_pool(views.details, request, item_id)
+
+
+async def watchlist(request):
+    return await render_in_pool(views.watchlist, request)
+
+
+async def category(request):
+    return await render_in_pool(views.category, request)
+
+
+async def search(request, category_id):
+    return await render_in_pool(views.search, request, category_id)
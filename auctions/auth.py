@@ -0,0 +1,113 @@
+import uuid
+
+from django.contrib.auth import get_user_model, user_logged_out
+from django.contrib.auth.backends import ModelBackend
+from django.core.cache import caches
+from django.db import router, transaction
+from django.db.models.signals import post_delete, post_save
+
+# pylint: disable=no-member
+
+# How long a cached user is trusted without a change signal, in seconds
+USER_CACHE_TIMEOUT = 60 * 15
+
+
+def user_cache():
+    return caches["sessions"]
+
+
+def user_key(user_id):
+    return f"user:{user_id}"
+
+
+def generation_key(user_id):
+    return f"user:{user_id}:generation"
+
+
+class CachedModelBackend(ModelBackend):
+    """ModelBackend that hydrates request.user from the sessions cache.
+
+    AuthenticationMiddleware calls get_user on every authenticated request;
+    this answers it without a query. The entry is dropped whenever the
+    user is saved (password change, last_login, admin edits) or deleted,
+    and on logout. Writes through queryset.update() are not seen and live
+    until the timeout.
+
+    Dropping replaces the user's generation token rather than deleting the
+    entry, and an entry is only used under the generation it was read in:
+    a request that read the row before a password change and stores it
+    after would otherwise bring the old hash back.
+
+    The cache is on disk, so the password hash is left out of it: only the
+    session hash made from it (User.get_session_auth_hash), which is what
+    every request checks. A cached user loads its password on first use.
+    """
+
+    def get_user(self, user_id):
+        cache = user_cache()
+        key, generation_at = user_key(user_id), generation_key(user_id)
+        found = cache.get_many([key, generation_at])
+        generation = found.get(generation_at)
+        if generation is None:
+            cache.add(generation_at, uuid.uuid4().hex, None)
+            generation = cache.get(generation_at)
+        cached = found.get(key)
+        if cached is not None and cached[0] == generation:
+            user = from_entry(cached[1])
+        else:
+            user = super().get_user(user_id)
+            if user is not None:
+                cache.set(key, (generation, entry(user)), USER_CACHE_TIMEOUT)
+        return user if user is not None and self.user_can_authenticate(user) else None
+
+
+def entry(user):
+    fields = {
+        field.attname: getattr(user, field.attname)
+        for field in user._meta.concrete_fields if field.attname != "password"
+    }
+    return fields, user.get_session_auth_hash()
+
+
+def from_entry(cached):
+    fields, session_auth_hash = cached
+    model = get_user_model()
+    # The password is left deferred
+    user = model.from_db(router.db_for_read(model), list(fields), list(fields.values()))
+    user.session_auth_hash = session_auth_hash
+    return user
+
+
+def cached_user(user_id):
+    """The user get_user would answer from the cache, None if it would read the row."""
+    found = user_cache().get_many([user_key(user_id), generation_key(user_id)])
+    cached = found.get(user_key(user_id))
+    if cached is not None and cached[0] == found.get(generation_key(user_id)):
+        return from_entry(cached[1])
+    return None
+
+
+def new_generation(user_id):
+    user_cache().set(generation_key(user_id), uuid.uuid4().hex, None)
+
+
+def drop_user(user_id):
+    new_generation(user_id)
+    # Again once the change is visible, in case a request read the old row
+    # in between
+    transaction.on_commit(lambda: new_generation(user_id))
+
+
+def forget_user(sender, instance, **kwargs):
+    drop_user(instance.pk)
+
+
+def forget_logged_out_user(sender, request, user, **kwargs):
+    if user is not None:
+        drop_user(user.pk)
+
+
+def connect_signals(user_model):
+    post_save.connect(forget_user, sender=user_model, dispatch_uid="auctions.forget_user.save")
+    post_delete.connect(forget_user, sender=user_model, dispatch_uid="auctions.forget_user.delete")
+    user_logged_out.connect(forget_logged_out_user, dispatch_uid="auctions.forget_user.logout")
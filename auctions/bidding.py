@@ -0,0 +1,73 @@
+import random
+import time
+from decimal import Decimal
+
+from django.conf import settings
+from django.db import OperationalError, transaction
+from django.db.models import F, Q
+from django.utils import timezone
+
+from .live import bid_event, publish
+from .models import Listing, Bid
+from .pagination import keyset_page
+
+# pylint: disable=no-member
+
+# How many times a bid is retried when the database is busy (SQLite answers
+# "database is locked" while another writer holds the lock)
+BID_RETRIES = 10
+BID_BACKOFF = 0.01
+
+
+class BidRejected(Exception):
+    """The offer was not accepted: too low or the listing is closed."""
+
+
+def place_bid(item_id, buyer, amount, retries=BID_RETRIES):
+    """Place a bid of `amount` on listing `item_id` for `buyer`.
+
+    The check and the update happen in a single conditional UPDATE, so two
+    bidders can never both win the same price, a sold listing is never
+    reopened and an ended timed auction takes no more bids. The Bid row is
+    written in the same transaction, which keeps the write lock until
+    commit. Returns the new Bid or raises BidRejected.
+    """
+    if amount is None:
+        raise BidRejected("Place a bid first!")
+    for attempt in range(retries + 1):
+        try:
+            with transaction.atomic():
+                updated = Listing.objects.filter(
+                    Q(ends_at__isnull=True) | Q(ends_at__gt=timezone.now()),
+                    pk=item_id,
+                    on_sell=True,
+                    actual_bid__lt=amount,
+                    price__lt=amount,
+                ).update(
+                    actual_bid=amount,
+                    bid_count=F("bid_count") + 1,
+                    leading_bidder=buyer,
+                    version=F("version") + 1,
+                )
+                if not updated:
+                    raise BidRejected(str(amount) + " € ISN'T ENOUGH!")
+                bid = Bid.objects.create(amount=amount, buyer=buyer, item_id=item_id)
+                transaction.on_commit(lambda: publish(bid_event(item_id, amount, buyer)))
+                return bid
+        except OperationalError:
+            if attempt == retries:
+                raise
+            # Back off with jitter so the waiting writers don't retry in lockstep
+            time.sleep(BID_BACKOFF * (2 ** attempt) * random.random())
+
+
+def bid_history(item_id, cursor=None, size=None):
+    """One page of a listing's bids, highest first, and the next cursor.
+
+    Walks bid_item_amount_idx with an (amount, id) keyset, so any page costs
+    the same however many bids the listing has.
+    """
+    if size is None:
+        size = getattr(settings, "BIDS_PAGE_SIZE", 20)
+    bids = Bid.objects.filter(item_id=item_id).select_related("buyer")
+    return keyset_page(bids, cursor, size, field="amount", parse=Decimal)
@@ -0,0 +1,96 @@
+"""The category names, loaded once per process.
+
+Nearly every page lists the categories (the listing form, the search
+form) and they almost never change, so each process keeps their ids and
+names in memory. A version token in the CATEGORY_CACHE alias, which every
+worker shares, is replaced whenever a Category is saved or deleted; a
+process that sees a token other than the one it loaded with reloads.
+
+The counts on the rows are kept by triggers on every listing write, which
+send no signals, so they are not kept here: the pages showing them read
+the rows.
+"""
+import threading
+import uuid
+from collections import namedtuple
+
+from django.conf import settings
+from django.core.cache import caches
+from django.db import transaction
+from django.db.models.signals import post_delete, post_save
+
+from .models import Category
+
+# pylint: disable=no-member
+
+VERSION_KEY = "categories:version"
+
+CategoryName = namedtuple("CategoryName", "id name")
+
+
+def version_cache():
+    return caches[getattr(settings, "CATEGORY_CACHE", "default")]
+
+
+def current_version():
+    cache = version_cache()
+    version = cache.get(VERSION_KEY)
+    if version is None:
+        # First worker up, or the cache was cleared: whoever adds wins
+        cache.add(VERSION_KEY, uuid.uuid4().hex, None)
+        version = cache.get(VERSION_KEY)
+    return version
+
+
+class CategoryRegistry:
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        # (version, CategoryNames in name order, {id: CategoryName}), swapped whole
+        self.state = (None, (), {})
+
+    def load(self):
+        version = current_version()
+        if version == self.state[0]:
+            return self.state
+        with self.lock:
+            if self.state[0] != version:
+                # The version is read before the rows, so a change made
+                # while loading shows up as a new version next time
+                categories = tuple(CategoryName(*row) for row in Category.objects.values_list("id", "name"))
+                self.state = (version, categories, {c.id: c for c in categories})
+            return self.state
+
+    def all(self):
+        return self.load()[1]
+
+    def get(self, category_id):
+        return self.load()[2].get(category_id)
+
+    def forget(self):
+        self.state = (None, (), {})
+
+
+registry = CategoryRegistry()
+
+
+def choices():
+    # A plain function: form fields are deep-copied along with their choices
+    return [(category.id, category.name) for category in registry.all()]
+
+
+def bump_version():
+    registry.forget()
+    version_cache().set(VERSION_KEY, uuid.uuid4().hex, None)
+
+
+def categories_changed(sender, using, **kwargs):
+    bump_version()
+    # Again once the change is visible to the other workers, in case one
+    # reloaded the old rows in between
+    transaction.on_commit(bump_version, using=using)
+
+
+def connect_signals():
+    post_save.connect(categories_changed, sender=Category, dispatch_uid="auctions.categories.save")
+    post_delete.connect(categories_changed, sender=Category, dispatch_uid="auctions.categories.delete")
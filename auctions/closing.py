@@ -0,0 +1,65 @@
+from django.db import transaction
+from django.db.models import F, OuterRef, Subquery
+from django.utils import timezone
+
+from .live import closed_event, publish
+from .models import Listing, Bid
+from .generations import purge
+
+# pylint: disable=no-member
+
+# Listings closed per transaction, small enough that bids waiting for the
+# write lock are not held up for long
+CLOSE_BATCH = 500
+
+
+def close_listings(listings):
+    """Close the open listings of `listings` with one UPDATE.
+
+    The highest bid of each becomes its winning_bid in the same statement,
+    and the card version is bumped. Returns the ids of the listings this
+    call closed, read back by that version: not the ones a concurrent sale
+    closed first.
+    """
+    top_bid = Bid.objects.filter(item=OuterRef("pk")).order_by("-amount", "pk").values("pk")[:1]
+    with transaction.atomic():
+        versions = dict(listings.filter(on_sell=True).values_list("pk", "version"))
+        Listing.objects.filter(pk__in=versions, on_sell=True).update(
+            on_sell=False,
+            winning_bid=Subquery(top_bid),
+            version=F("version") + 1,
+        )
+        closed = {
+            pk: category
+            for pk, version, category in Listing.objects.filter(pk__in=versions, on_sell=False)
+            .values_list("pk", "version", "category_id")
+            if version == versions[pk] + 1
+        }
+        # An UPDATE sends no signal: purge the cached pages of what it
+        # closed, after it, so no page rendered in between outlives the sale
+        purge(list(closed), list(closed.values()))
+    return list(closed)
+
+
+def close_expired(now=None, batch_size=CLOSE_BATCH):
+    """Close every timed auction whose ends_at has passed, a batch at a time.
+
+    Each batch reads the ids of the due listings from listing_due_idx and
+    closes them in its own short transaction. Returns how many were closed.
+    """
+    now = now or timezone.now()
+    closed = 0
+    while True:
+        with transaction.atomic():
+            due = list(
+                Listing.objects.filter(on_sell=True, ends_at__lte=now)
+                .order_by("ends_at").values_list("pk", flat=True)[:batch_size]
+            )
+            if not due:
+                break
+            ids = close_listings(Listing.objects.filter(pk__in=due))
+            closed += len(ids)
+            transaction.on_commit(lambda ids=ids: [publish(closed_event(pk)) for pk in ids])
+        if len(due) < batch_size:
+            break
+    return closed
@@ -0,0 +1,132 @@
+"""Conditional GET for the listing and feed pages.
+
+A listing page is current as long as its row is (bids, sales, edits and
+comments all move Listing.updated_at, triggers.py) and so is the token of
+its page (generations.py), which a rename of its owner or bidder replaces.
+A feed page is current
+as long as the generation tokens of its scope (generations.py), replaced
+whenever what its cards or counts show changes, and the category version
+(categories.py, replaced on a rename) stay the same; checking them costs
+no query. Each ETag also carries who is looking, since the pages greet
+the user and show their watchlist state, so a cached anonymous page is
+never shown to a user or the other way round; a user's also carries their
+session and CSRF token, which the bid and comment forms hold, so a page
+from before a new login is not reused. Last-Modified is only sent
+on anonymous listing pages, where updated_at alone decides.
+
+A listing page check is one indexed query, made before the page's own
+queries; a match answers 304 without running the view. A listing page
+requested without a validator skips it: the view records the row it
+showed (remember_listing) and the headers are made from that.
+"""
+import functools
+import hashlib
+
+from django.db.models import Exists, OuterRef
+from django.utils.cache import patch_cache_control, quote_etag
+from django.utils.http import http_date
+from django.views.decorators.http import condition
+
+from .categories import current_version
+from .generations import generations, listing_page, page_scopes
+from .models import Listing, Watchlist
+
+# pylint: disable=no-member
+
+# Part of every ETag: bump it when a template change alters the pages
+PAGES_VERSION = 1
+
+
+def viewer(request):
+    user = request.user
+    if not user.is_authenticated:
+        return "anonymous"
+    session = getattr(request, "session", None)
+    session_key = session.session_key if session is not None else None
+    return f"user:{user.pk}:{user.username}:{session_key}:{request.META.get('CSRF_COOKIE', '')}"
+
+
+def make_etag(*parts):
+    return hashlib.md5("|".join(str(part) for part in (PAGES_VERSION,) + parts).encode()).hexdigest()
+
+
+def listing_state(request, item_id):
+    """(updated_at, watched) of the listing, None if it does not exist; read once per request."""
+    if not hasattr(request, "_listing_state"):
+        rows = Listing.objects.filter(pk=item_id)
+        if request.user.is_authenticated:
+            watched = Exists(Watchlist.objects.filter(user=request.user, item=OuterRef("pk")))
+            state = rows.annotate(watched=watched).values_list("updated_at", "watched").first()
+        else:
+            state = rows.values_list("updated_at", flat=True).first()
+            state = None if state is None else (state, False)
+        request._listing_state = state
+    return request._listing_state
+
+
+def remember_listing(request, item):
+    """Let the ETag of this response describe `item` as the page showed it."""
+    request._listing_state = (item.updated_at, item.watched)
+
+
+def listing_etag(request, item_id):
+    state = listing_state(request, item_id)
+    if state is None:
+        return None
+    updated_at, watched = state
+    tokens = generations(page_scopes(listing_page, item_id))
+    return make_etag("listing", item_id, updated_at.isoformat(), *tokens, watched, viewer(request))
+
+
+def listing_last_modified(request, item_id):
+    if request.user.is_authenticated:
+        return None
+    state = listing_state(request, item_id)
+    return state and state[0]
+
+
+def feed_etag(scope):
+    """The ETag function of the feed pages of `scope`, as anonymous_page takes it."""
+    def etag(request, *args, **kwargs):
+        tokens = generations(page_scopes(scope, *args, **kwargs))
+        return make_etag("feed", *tokens, current_version(), viewer(request))
+    return etag
+
+
+def has_validators(request):
+    return "HTTP_IF_NONE_MATCH" in request.META or "HTTP_IF_MODIFIED_SINCE" in request.META
+
+
+def revalidate(etag_func, last_modified_func=None, recorded=False):
+    """Answer GET and HEAD with 304 when the ETag (or date) still matches.
+
+    With `recorded` the view calls remember_listing, so a request without
+    validators runs it straight away and takes its headers from that.
+    The responses may be stored but must be revalidated on every use, and
+    only by the browser once a user is logged in.
+    """
+    def decorator(view):
+        conditional = condition(etag_func=etag_func, last_modified_func=last_modified_func)(view)
+
+        @functools.wraps(view)
+        def wrapper(request, *args, **kwargs):
+            if request.method not in ("GET", "HEAD"):
+                return view(request, *args, **kwargs)
+            if recorded and not has_validators(request):
+                response = view(request, *args, **kwargs)
+                if response.status_code == 200:
+                    etag = etag_func(request, *args, **kwargs)
+                    if etag:
+                        response["ETag"] = quote_etag(etag)
+                    last_modified = last_modified_func and last_modified_func(request, *args, **kwargs)
+                    if last_modified:
+                        response["Last-Modified"] = http_date(last_modified.timestamp())
+            else:
+                response = conditional(request, *args, **kwargs)
+            if request.user.is_authenticated:
+                patch_cache_control(response, no_cache=True, private=True)
+            else:
+                patch_cache_control(response, no_cache=True)
+            return response
+        return wrapper
+    return decorator
@@ -0,0 +1,48 @@
+from django.conf import settings
+from django.db.models import Exists, OuterRef, Value, BooleanField
+from django.shortcuts import get_object_or_404
+
+from .models import Listing, Comment, Watchlist
+from .pagination import keyset_page
+
+# pylint: disable=no-member
+
+
+class ListingDetail:
+    """Everything the listing page shows, loaded in a fixed number of queries.
+
+    One query for the listing with its owner, category, leading bidder and
+    the viewer's watchlist state, and one for the first page of comments
+    with their authors. Older comments are fetched page by page from the
+    comments view.
+    """
+
+    def __init__(self, item, comments, next_comments=None):
+        self.item = item
+        self.comments = comments
+        self.next_comments = next_comments
+
+    @classmethod
+    def load(cls, item_id, user):
+        if user.is_authenticated:
+            watched = Exists(Watchlist.objects.filter(user=user, item=OuterRef("pk")))
+        else:
+            watched = Value(False, output_field=BooleanField())
+        item = get_object_or_404(
+            Listing.objects.select_related("owner", "category", "leading_bidder").annotate(watched=watched),
+            pk=item_id,
+        )
+        comments, next_comments = comment_page(item.pk)
+        return cls(item, comments, next_comments)
+
+    def is_owner(self, user):
+        return user.is_authenticated and user.pk == self.item.owner_id
+
+
+def comment_page(item_id, cursor=None):
+    """A page of the listing's comments, newest first, and the next cursor."""
+    return keyset_page(
+        Comment.objects.filter(item_id=item_id).select_related("user"),
+        cursor,
+        size=getattr(settings, "COMMENTS_PAGE_SIZE", 20),
+    )
@@ -0,0 +1,102 @@
+"""Generation tokens of the cached pages and their ETags.
+
+Each page belongs to a scope: a listing's page to its listing, each feed
+to what its cards are drawn from (all listings, the open ones, the open
+ones of one category, the category counts). A scope's token, kept in the
+"pages" cache alias which every worker shares, is replaced whenever what
+the pages of the scope show changes, and the anonymous page cache
+(pagecache.py) and the ETags (conditional.py) are both made from it, so
+an unchanged page keeps its cache entry and answers 304.
+
+Every page also carries the FEEDS token, replaced when no narrower scope
+says what changed (an admin edit, a bulk load). New bids and comments
+only replace their listing's token: the cards show neither.
+"""
+import uuid
+
+from django.conf import settings
+from django.core.cache import caches
+from django.db import transaction
+
+# pylint: disable=no-member
+
+FEEDS = "feeds"
+ALL = "feed:all"
+ON_SELL = "feed:on_sell"
+CATEGORIES = "feed:categories"
+
+
+def category_feed(category_id):
+    """The scope of a category's open listings."""
+    return f"feed:category:{category_id}"
+
+
+def listing_page(item_id):
+    return f"listing:{item_id}"
+
+
+def page_cache():
+    return caches[getattr(settings, "PAGE_CACHE", "pages")]
+
+
+def generation_key(scope):
+    return f"page:generation:{scope}"
+
+
+def page_scopes(scope, *args, **kwargs):
+    """FEEDS and the scope of a page, given as a name or as a function of
+    the view's arguments."""
+    return [FEEDS, scope(*args, **kwargs) if callable(scope) else scope]
+
+
+def generations(scopes):
+    """The tokens of `scopes` in order, making a fresh one for any the cache has lost."""
+    cache = page_cache()
+    keys = [generation_key(scope) for scope in scopes]
+    found = cache.get_many(keys)
+    tokens = []
+    for key in keys:
+        token = found.get(key)
+        if token is None:
+            cache.add(key, uuid.uuid4().hex, None)
+            token = cache.get(key)
+        tokens.append(token)
+    return tokens
+
+
+def bump(scopes):
+    page_cache().set_many({generation_key(scope): uuid.uuid4().hex for scope in scopes}, None)
+
+
+def replace(scopes):
+    bump(scopes)
+    # Again once the change is visible, in case a page was rendered from
+    # the old rows in between
+    transaction.on_commit(lambda: bump(scopes))
+
+
+def purge(item_ids=(), categories=None):
+    """Drop the pages of `item_ids` and the feeds that may show them, now and
+    once the transaction commits.
+
+    With `categories`, the ids of the categories the listings are (or were)
+    in, those are the feeds of all and open listings, the category counts
+    and those categories' listings; without, every feed.
+    """
+    scopes = [listing_page(pk) for pk in item_ids]
+    if categories is None:
+        scopes.append(FEEDS)
+    else:
+        scopes += [ALL, ON_SELL, CATEGORIES] + [category_feed(pk) for pk in set(categories)]
+    replace(scopes)
+
+
+def purge_listings(listings):
+    """purge() the listings of a queryset and their categories' feeds."""
+    rows = list(listings.values_list("pk", "category_id"))
+    purge([pk for pk, _ in rows], [category for _, category in rows])
+
+
+def purge_pages(item_ids):
+    """Drop only the pages of `item_ids`, for changes their cards do not show."""
+    replace([listing_page(pk) for pk in item_ids])
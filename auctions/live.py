@@ -0,0 +1,216 @@
+import asyncio
+import json
+import os
+import socket
+from collections import defaultdict
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.db import close_old_connections
+
+from .models import Listing
+from .routers import read_only
+
+# Events a slow subscriber may fall behind by; older ones are dropped since
+# only the latest state of a listing matters
+QUEUE_SIZE = 8
+# Seconds between keep-alive comments on an idle event stream
+HEARTBEAT = 15
+
+EVENT_STREAM_HEADERS = [
+    (b"content-type", b"text/event-stream"),
+    (b"cache-control", b"no-cache"),
+    (b"x-accel-buffering", b"no"),
+]
+
+
+def bid_event(item_id, amount, buyer):
+    return {"id": int(item_id), "price": str(amount), "buyer": str(buyer), "on_sell": True}
+
+
+def closed_event(item_id):
+    return {"id": int(item_id), "on_sell": False}
+
+
+class Hub:
+    """In-process pub/sub of listing events for the live bid streams.
+
+    Subscribers are asyncio queues living on the ASGI event loop; `publish`
+    may be called from any thread (the sync views run in a thread pool).
+    With LIVE_EVENTS_DIR set, every subscribing process also binds a unix
+    datagram socket in that directory and publishers send each event to
+    all of them, so bids taken by one worker reach the streams of the others.
+    """
+
+    def __init__(self):
+        self.loop = None
+        self.channels = defaultdict(set)
+        self.listener = None
+        self.sender = None
+
+    def directory(self):
+        return getattr(settings, "LIVE_EVENTS_DIR", None)
+
+    def own_socket(self):
+        return os.path.join(self.directory(), f"{os.getpid()}.sock")
+
+    def subscribe(self, item_id):
+        loop = asyncio.get_running_loop()
+        if loop is not self.loop:
+            self.loop = loop
+            self.channels.clear()
+            self.listen()
+            self.loop.call_later(HEARTBEAT, self.heartbeat, loop)
+        queue = asyncio.Queue(maxsize=QUEUE_SIZE)
+        self.channels[item_id].add(queue)
+        return queue
+
+    def unsubscribe(self, item_id, queue):
+        subscribers = self.channels.get(item_id)
+        if subscribers is not None:
+            subscribers.discard(queue)
+            if not subscribers:
+                del self.channels[item_id]
+
+    def subscribers(self):
+        return sum(len(queues) for queues in self.channels.values())
+
+    def deliver(self, event):
+        # Runs on the event loop
+        for queue in self.channels.get(event["id"], ()):
+            if queue.full():
+                queue.get_nowait()
+            queue.put_nowait(event)
+
+    def heartbeat(self, loop):
+        # One timer for all streams: a None tells each one to send a
+        # keep-alive comment
+        if loop is not self.loop:
+            return
+        for queues in self.channels.values():
+            for queue in queues:
+                if not queue.full():
+                    queue.put_nowait(None)
+        loop.call_later(HEARTBEAT, self.heartbeat, loop)
+
+    def publish(self, event):
+        if self.loop is not None and not self.loop.is_closed():
+            self.loop.call_soon_threadsafe(self.deliver, event)
+        if self.directory():
+            self.broadcast(event)
+
+    def listen(self):
+        if not self.directory():
+            return
+        if self.listener is not None:
+            self.listener.close()
+        os.makedirs(self.directory(), exist_ok=True)
+        path = self.own_socket()
+        if os.path.exists(path):
+            os.unlink(path)
+        self.listener = socket.socket(socket.AF_UNIX, socket.SOCK_DGRAM)
+        self.listener.bind(path)
+        self.listener.setblocking(False)
+        self.loop.add_reader(self.listener.fileno(), self.receive)
+
+    def receive(self):
+        while True:
+            try:
+                data = self.listener.recv(65536)
+            except BlockingIOError:
+                return
+            self.deliver(json.loads(data))
+
+    def broadcast(self, event):
+        if self.sender is None:
+            self.sender = socket.socket(socket.AF_UNIX, socket.SOCK_DGRAM)
+            self.sender.setblocking(False)
+        data = json.dumps(event).encode()
+        own = self.own_socket() if self.listener is not None else None
+        for name in os.listdir(self.directory()):
+            path = os.path.join(self.directory(), name)
+            if not name.endswith(".sock") or path == own:
+                continue
+            try:
+                self.sender.sendto(data, path)
+            except (ConnectionRefusedError, FileNotFoundError):
+                # The worker that bound it is gone
+                try:
+                    os.unlink(path)
+                except FileNotFoundError:
+                    pass
+            except BlockingIOError:
+                # Its buffer is full, that worker's streams miss this event
+                pass
+
+
+hub = Hub()
+
+
+def publish(event):
+    hub.publish(event)
+
+
+async def wait_for_disconnect(receive):
+    while (await receive())["type"] != "http.disconnect":
+        pass
+
+
+@read_only
+def listing_on_sell(item_id):
+    """Whether the listing is on sell, None if there is no such listing."""
+    close_old_connections()
+    try:
+        return Listing.objects.filter(pk=item_id).values_list("on_sell", flat=True).first()
+    finally:
+        close_old_connections()
+
+
+async def listing_events(scope, receive, send, item_id):
+    """ASGI app streaming the events of one listing as server-sent events.
+
+    404 for a listing that does not exist. A closed one gets its closed
+    event and the response ends, nothing else will happen to it.
+    """
+    on_sell = await sync_to_async(listing_on_sell)(item_id)
+    if on_sell is None:
+        await send({"type": "http.response.start", "status": 404, "headers": [(b"content-type", b"text/plain")]})
+        await send({"type": "http.response.body", "body": b"Not Found"})
+    elif not on_sell:
+        await send({"type": "http.response.start", "status": 200, "headers": EVENT_STREAM_HEADERS})
+        await send({"type": "http.response.body", "body": f"retry: 5000\ndata: {json.dumps(closed_event(item_id))}\n\n".encode()})
+    else:
+        await stream_listing(receive, send, item_id)
+
+
+async def stream_listing(receive, send, item_id):
+    """Send the events of the listing until the client disconnects."""
+    queue = hub.subscribe(item_id)
+    stream = asyncio.ensure_future(send_events(send, queue))
+    # A disconnect cancels the stream instead of being raced against every
+    # event, which keeps an idle stream down to one pending queue.get()
+    watcher = asyncio.ensure_future(wait_for_disconnect(receive))
+    watcher.add_done_callback(lambda _: stream.cancel())
+    try:
+        await stream
+    except asyncio.CancelledError:
+        # Cancelled by the watcher: the client went away. Otherwise this
+        # request is being cancelled, and the stream with it
+        if not watcher.done():
+            raise
+    finally:
+        hub.unsubscribe(item_id, queue)
+        watcher.cancel()
+        stream.cancel()
+
+
+async def send_events(send, queue):
+    await send({"type": "http.response.start", "status": 200, "headers": EVENT_STREAM_HEADERS})
+    await send({"type": "http.response.body", "body": b"retry: 5000\n\n", "more_body": True})
+    while True:
+        event = await queue.get()
+        if event is None:
+            body = b": keep-alive\n\n"
+        else:
+            body = f"data: {json.dumps(event)}\n\n".encode()
+        await send({"type": "http.response.body", "body": body, "more_body": True})
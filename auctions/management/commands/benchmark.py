@@ -0,0 +1,270 @@
+import io
+import json
+import os
+import platform
+import statistics
+import subprocess
+import tempfile
+import time
+from collections import Counter
+from contextlib import ExitStack, contextmanager
+from typing import Callable, NamedTuple, Optional
+
+import django
+from django.conf import settings
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.management.base import BaseCommand
+from django.db import connections
+from django.db.models import Count
+from django.test import Client
+from django.test.utils import override_settings, setup_databases, teardown_databases
+from django.urls import get_resolver, reverse
+from PIL import Image
+
+from auctions.metrics import Measurement
+from auctions.models import Listing, User
+from auctions.synthetic import PASSWORD, SCALES, generate
+
+# pylint: disable=no-member
+
+# What the throwaway database runs with: nothing shared with a dev server
+# on the same checkout, no throttling, thumbnails made inline
+ISOLATED = {
+    "CACHES": {
+        alias: {"BACKEND": "django.core.cache.backends.locmem.LocMemCache", "LOCATION": f"benchmark-{alias}"}
+        for alias in ("default", "template_fragments", "sessions", "pages")
+    },
+    "THROTTLE_RATES": {},
+    "THUMBNAIL_WORKERS": 0,
+    "ALLOWED_HOSTS": ["testserver"],
+}
+
+
+class Fixture:
+    """The rows the routes are pointed at, picked from whatever data there is."""
+
+    def __init__(self):
+        busiest = (Listing.objects.filter(on_sell=True).values("owner")
+                   .annotate(listings=Count("id")).order_by("-listings").first())
+        self.user = User.objects.get(pk=busiest["owner"])
+        self.owned = list(Listing.objects.filter(owner=self.user, on_sell=True).values_list("id", flat=True))
+        self.item = Listing.objects.filter(on_sell=True).exclude(owner=self.user).order_by("-bid_count").first()
+        self.query = self.item.title.split()[0]
+        self.bid = self.item.actual_bid or self.item.price
+        buffer = io.BytesIO()
+        Image.new("RGB", (640, 480), (90, 120, 200)).save(buffer, "JPEG")
+        self.image = buffer.getvalue()
+
+    def prepare(self):
+        # Only in a throwaway database: staff for the staff pages, a known password to log in
+        self.user.is_staff = True
+        self.user.set_password(PASSWORD)
+        self.user.save()
+
+    def next_bid(self):
+        self.bid += 1
+        return str(self.bid)
+
+
+class Route(NamedTuple):
+    name: str
+    method: str
+    url: Callable
+    data: Optional[Callable] = None
+    login: bool = True
+    writes: bool = False
+    before: Optional[Callable] = None
+
+
+def item_url(name):
+    return lambda f, n: reverse(name, args=(f.item.id,))
+
+
+# Every named route in auctions/urls.py, some twice (page and form POST)
+ROUTES = [
+    Route("index", "get", lambda f, n: reverse("index")),
+    Route("all", "get", lambda f, n: reverse("all")),
+    Route("all", "get", lambda f, n: reverse("all"), login=False),
+    Route("details", "get", item_url("details")),
+    Route("details", "get", item_url("details"), login=False),
+    Route("details", "post", item_url("details"), lambda f, n: {"bid": f.next_bid()}, writes=True),
+    Route("listing_events", "get", item_url("listing_events")),
+    Route("watchlist", "get", lambda f, n: reverse("watchlist")),
+    Route("add", "get", item_url("add"), writes=True),
+    Route("remove", "get", item_url("remove"), writes=True),
+    Route("comments", "get", item_url("comments")),
+    Route("add_comment", "post", item_url("add_comment"), lambda f, n: {"comment": f"Benchmark comment {n}"}, writes=True),
+    Route("sell", "get", lambda f, n: reverse("sell", args=(f.owned[n % len(f.owned)],)), writes=True),
+    Route("category", "get", lambda f, n: reverse("category")),
+    Route("searchCategory", "get", lambda f, n: reverse("searchCategory", args=(f.item.category_id,))),
+    Route("search", "get", lambda f, n: reverse("search") + f"?q={f.query}"),
+    Route("create", "get", lambda f, n: reverse("create")),
+    Route("create", "post", lambda f, n: reverse("create"), lambda f, n: {
+        "title": f"Benchmark {n}", "description": "Made by the benchmark", "price": "10",
+        "choice": f.item.category_id, "image": SimpleUploadedFile(f"bench{n}.jpg", f.image, "image/jpeg"),
+    }, writes=True),
+    Route("login", "get", lambda f, n: reverse("login"), login=False),
+    Route("login", "post", lambda f, n: reverse("login"),
+          lambda f, n: {"username": f.user.username, "password": PASSWORD}, login=False, writes=True),
+    Route("logout", "get", lambda f, n: reverse("logout"), writes=True,
+          before=lambda client, f: client.force_login(f.user)),
+    Route("register", "get", lambda f, n: reverse("register"), login=False),
+    Route("register", "post", lambda f, n: reverse("register"), lambda f, n: {
+        "username": f"benchmark{n}-{time.monotonic_ns()}", "email": "benchmark@example.com",
+        "password": PASSWORD, "confirmation": PASSWORD,
+    }, login=False, writes=True),
+    Route("api_listings", "get", lambda f, n: reverse("api_listings")),
+    Route("api_listing", "get", lambda f, n: reverse("api_listing", args=(f.item.id,))),
+    Route("api_bids", "get", lambda f, n: reverse("api_bids", args=(f.item.id,))),
+    Route("api_changes", "get", lambda f, n: reverse("api_changes")),
+    Route("api_export", "get", lambda f, n: reverse("api_export") + "?fields=id,title,price"),
+    Route("api_categories", "get", lambda f, n: reverse("api_categories")),
+    Route("throttle_stats", "get", lambda f, n: reverse("throttle_stats")),
+    Route("metrics", "get", lambda f, n: reverse("metrics")),
+]
+
+
+def uncovered_routes():
+    """Named routes of the site that ROUTES does not exercise."""
+    named = {name for name in get_resolver().reverse_dict if isinstance(name, str)}
+    return named - {route.name for route in ROUTES}
+
+
+def percentile(values, fraction):
+    # Nearest rank
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, max(0, round(fraction * len(ordered)) - 1))]
+
+
+def label(route):
+    return f"{route.method.upper()} {route.name}{'' if route.login else ' (anonymous)'}"
+
+
+def request(client, route, fixture, n):
+    data = route.data(fixture, n) if route.data else None
+    call = getattr(client, route.method)
+    response = call(route.url(fixture, n), data) if data is not None else call(route.url(fixture, n))
+    if response.streaming:
+        b"".join(response.streaming_content)
+    return response
+
+
+def run_routes(iterations, writes=True, fixture=None):
+    """Request every route `iterations` times; {label: stats} in milliseconds."""
+    fixture = fixture or Fixture()
+    results = {}
+    for route in ROUTES:
+        if route.writes and not writes:
+            continue
+        client = Client()
+        if route.login:
+            client.force_login(fixture.user)
+        if route.before:
+            route.before(client, fixture)
+        # One untimed request to warm caches and connections
+        request(client, route, fixture, -1)
+        times = []
+        queries = []
+        statuses = Counter()
+        for n in range(iterations):
+            if route.before:
+                route.before(client, fixture)
+            measurement = Measurement()
+            with ExitStack() as stack:
+                for connection in connections.all():
+                    stack.enter_context(connection.execute_wrapper(measurement))
+                start = time.perf_counter()
+                response = request(client, route, fixture, n)
+                times.append(time.perf_counter() - start)
+            queries.append(len(measurement.queries))
+            statuses[response.status_code] += 1
+        results[label(route)] = {
+            "p50_ms": round(percentile(times, 0.50) * 1000, 3),
+            "p95_ms": round(percentile(times, 0.95) * 1000, 3),
+            "p99_ms": round(percentile(times, 0.99) * 1000, 3),
+            "mean_ms": round(statistics.mean(times) * 1000, 3),
+            "queries": round(statistics.mean(queries), 2),
+            "max_queries": max(queries),
+            "requests_per_second": round(len(times) / sum(times), 1),
+            "statuses": {str(status): count for status, count in sorted(statuses.items())},
+        }
+    return results
+
+
+def commit():
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True,
+                              cwd=settings.BASE_DIR, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def meta(**fields):
+    """What a report was measured on, so that two can be compared."""
+    return dict(commit=commit(), python=platform.python_version(), django=django.get_version(), **fields)
+
+
+@contextmanager
+def generated_database(scale, seed, log=None):
+    """A throwaway database file filled by auctions.synthetic; yields the Fixture."""
+    with tempfile.TemporaryDirectory() as directory, \
+            override_settings(MEDIA_ROOT=os.path.join(directory, "media"), **ISOLATED):
+        connections["default"].settings_dict["TEST"]["NAME"] = os.path.join(directory, "benchmark.sqlite3")
+        databases = setup_databases(verbosity=0, interactive=False, aliases={"default"})
+        try:
+            generate(**SCALES[scale], seed=seed, log=log)
+            fixture = Fixture()
+            fixture.prepare()
+            yield fixture
+        finally:
+            teardown_databases(databases, verbosity=0)
+
+
+class Command(BaseCommand):
+    help = (
+        "Time every route of the site through the test client and report latency "
+        "percentiles, queries per request and throughput as JSON."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--scale", choices=SCALES, default="small", help="Size of the generated dataset")
+        parser.add_argument("--seed", type=int, default=1)
+        parser.add_argument("--iterations", type=int, default=50, help="Timed requests per route")
+        parser.add_argument("--output", help="Write the JSON report here (default: stdout)")
+        parser.add_argument("--existing", action="store_true",
+                            help="Run the read-only routes against the configured database instead of a generated one")
+
+    def handle(self, *args, **options):
+        missing = uncovered_routes()
+        if missing:
+            self.stderr.write(f"Not benchmarked: {', '.join(sorted(missing))}")
+
+        started = time.perf_counter()
+        if options["existing"]:
+            with override_settings(ALLOWED_HOSTS=["testserver"]):
+                results = run_routes(options["iterations"], writes=False)
+        else:
+            with generated_database(options["scale"], options["seed"], self.stderr.write) as fixture:
+                results = run_routes(options["iterations"], fixture=fixture)
+
+        report = {
+            "meta": meta(
+                scale=None if options["existing"] else options["scale"],
+                seed=options["seed"],
+                iterations=options["iterations"],
+                seconds=round(time.perf_counter() - started, 1),
+            ),
+            "routes": results,
+        }
+        text = json.dumps(report, indent=2, sort_keys=True)
+        if options["output"]:
+            with open(options["output"], "w") as output:
+                output.write(text + "\n")
+            for name, stats in results.items():
+                self.stdout.write(
+                    f"{name:<40} p50 {stats['p50_ms']:8.2f}  p95 {stats['p95_ms']:8.2f}  "
+                    f"p99 {stats['p99_ms']:8.2f} ms  {stats['queries']:6.1f} queries  "
+                    f"{stats['requests_per_second']:8.1f} req/s"
+                )
+        else:
+            self.stdout.write(text)
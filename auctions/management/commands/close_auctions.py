@@ -0,0 +1,26 @@
+import time
+
+from django.core.management.base import BaseCommand
+from django.db import connection
+
+from auctions.closing import CLOSE_BATCH, close_expired
+
+
+class Command(BaseCommand):
+    help = "Close the timed auctions that have ended, once or as a long-running worker."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--loop", action="store_true", help="Keep running, one tick every --interval seconds")
+        parser.add_argument("--interval", type=float, default=5.0)
+        parser.add_argument("--batch-size", type=int, default=CLOSE_BATCH)
+
+    def handle(self, *args, **options):
+        while True:
+            start = time.perf_counter()
+            closed = close_expired(batch_size=options["batch_size"])
+            if closed or not options["loop"]:
+                self.stdout.write(f"Closed {closed} auctions in {time.perf_counter() - start:.2f}s")
+            if not options["loop"]:
+                return
+            connection.close_if_unusable_or_obsolete()
+            time.sleep(max(0.0, options["interval"] - (time.perf_counter() - start)))
@@ -0,0 +1,132 @@
+import os
+import shutil
+import statistics
+import tempfile
+import threading
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.db import OperationalError
+from django.db.utils import ConnectionHandler
+
+SCHEMA = [
+    "CREATE TABLE listing (id INTEGER PRIMARY KEY, actual_bid REAL NOT NULL, bid_count INTEGER NOT NULL)",
+    "CREATE TABLE bid (id INTEGER PRIMARY KEY, item_id INTEGER NOT NULL, amount REAL NOT NULL)",
+    "CREATE INDEX bid_item_amount ON bid (item_id, amount DESC)",
+]
+LISTINGS = 100
+
+
+def profiles():
+    """The plain backend and the one configured in settings, on a scratch file."""
+    tuned = {key: value for key, value in settings.DATABASES["default"].items() if key != "TEST"}
+    tuned["CONN_MAX_AGE"] = None
+    return {
+        "plain": {"ENGINE": "django.db.backends.sqlite3"},
+        "tuned": tuned,
+    }
+
+
+def write(db, item_id, amount):
+    # What place_bid does: raise the listing and record the bid in one transaction
+    db.set_autocommit(False, force_begin_transaction_with_broken_autocommit=True)
+    try:
+        with db.cursor() as cursor:
+            cursor.execute(
+                "UPDATE listing SET actual_bid = %s, bid_count = bid_count + 1 WHERE id = %s",
+                [amount, item_id],
+            )
+            cursor.execute("INSERT INTO bid (item_id, amount) VALUES (%s, %s)", [item_id, amount])
+        db.commit()
+    except OperationalError:
+        db.rollback()
+        raise
+    finally:
+        db.set_autocommit(True)
+
+
+def read(db, item_id):
+    with db.cursor() as cursor:
+        cursor.execute("SELECT actual_bid, bid_count FROM listing WHERE id = %s", [item_id])
+        cursor.fetchone()
+        cursor.execute("SELECT amount FROM bid WHERE item_id = %s ORDER BY amount DESC LIMIT 20", [item_id])
+        cursor.fetchall()
+
+
+def run(profile, path, writers, writes, readers):
+    databases = {alias: dict(profile, NAME=path) for alias in ("default", "read")}
+    if "PRAGMAS" in profile:
+        databases["read"]["PRAGMAS"] = dict(profile["PRAGMAS"], query_only="ON")
+        databases["read"].pop("TRANSACTION_MODE", None)
+    # Connections are per thread, like in the app
+    connections = ConnectionHandler(databases)
+    with connections["default"].cursor() as cursor:
+        for statement in SCHEMA:
+            cursor.execute(statement)
+        cursor.executemany("INSERT INTO listing VALUES (%s, 0, 0)", [(pk,) for pk in range(1, LISTINGS + 1)])
+    connections["default"].close()
+
+    errors = []
+    latencies = []
+    done = threading.Event()
+
+    def writer(number):
+        db = connections["default"]
+        for n in range(writes):
+            try:
+                write(db, (number * writes + n) % LISTINGS + 1, n + 1)
+            except OperationalError as error:
+                errors.append(error)
+        db.close()
+
+    def reader(number):
+        db = connections["read"]
+        n = number
+        while not done.is_set():
+            start = time.perf_counter()
+            read(db, n % LISTINGS + 1)
+            latencies.append(time.perf_counter() - start)
+            n += 1
+        db.close()
+
+    reading = [threading.Thread(target=reader, args=(n,)) for n in range(readers)]
+    writing = [threading.Thread(target=writer, args=(n,)) for n in range(writers)]
+    for thread in reading:
+        thread.start()
+    start = time.perf_counter()
+    for thread in writing:
+        thread.start()
+    for thread in writing:
+        thread.join()
+    elapsed = time.perf_counter() - start
+    done.set()
+    for thread in reading:
+        thread.join()
+    return elapsed, errors, sorted(latencies)
+
+
+class Command(BaseCommand):
+    help = "Compare bid write throughput and read latency of the plain and the tuned SQLite profile."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--writers", type=int, default=8)
+        parser.add_argument("--writes", type=int, default=200, help="Transactions per writer")
+        parser.add_argument("--readers", type=int, default=4)
+
+    def handle(self, *args, **options):
+        directory = tempfile.mkdtemp()
+        try:
+            for name, profile in profiles().items():
+                path = os.path.join(directory, f"{name}.sqlite3")
+                elapsed, errors, latencies = run(
+                    profile, path, options["writers"], options["writes"], options["readers"])
+                committed = options["writers"] * options["writes"] - len(errors)
+                p99 = latencies[int(len(latencies) * 0.99)] if latencies else 0
+                median = statistics.median(latencies) if latencies else 0
+                self.stdout.write(
+                    f"{name:>6}: {committed / elapsed:7.0f} writes/s, {len(errors)} failed, "
+                    f"read median {median * 1000:.2f} ms, p99 {p99 * 1000:.2f} ms ({len(latencies)} reads)"
+                )
+        finally:
+            shutil.rmtree(directory)
@@ -0,0 +1,117 @@
+import os
+import shutil
+import uuid
+
+from django.core.files import File
+from django.core.management.base import BaseCommand
+from django.db.models import F
+
+from auctions.generations import purge
+from auctions.models import Listing
+from auctions.storage import CONTENT_ADDRESSED_NAME, content_hash, content_name
+from auctions.thumbnails import variant_name
+
+# pylint: disable=no-member
+
+
+class Command(BaseCommand):
+    help = ("Move listing images to content-addressed names, point the listings at them "
+            "and delete the duplicate copies left in the upload directory.")
+
+    def add_arguments(self, parser):
+        parser.add_argument("--dry-run", action="store_true", help="Only report what would change")
+
+    def hash_file(self, name):
+        with self.storage.open(name) as content:
+            return content_hash(File(content))
+
+    def stored(self, name):
+        return name in self.placed or self.storage.exists(name)
+
+    def place(self, old, new):
+        """Make `new` hold the bytes of `old`, which stays where it is.
+
+        A hard link where the file system allows one, else a copy; written
+        under a private name and renamed, like ContentAddressedStorage does.
+        """
+        if not self.dry_run and not self.storage.exists(new):
+            path = self.storage.path(new)
+            temporary = os.path.join(os.path.dirname(path), f".{uuid.uuid4().hex}.tmp")
+            try:
+                os.link(self.storage.path(old), temporary)
+            except OSError:
+                shutil.copyfile(self.storage.path(old), temporary)
+            os.replace(temporary, path)
+        self.placed.add(new)
+
+    def discard(self, name):
+        if not self.dry_run:
+            self.storage.delete(name)
+
+    def handle(self, *args, **options):
+        self.dry_run = options["dry_run"]
+        field = Listing._meta.get_field("image")
+        self.storage = field.storage
+        self.placed = set()
+        # The referenced files and their variants, all dealt with below
+        handled = set()
+        reclaimed = 0
+        rewritten = 0
+
+        # Listing images first: every referenced file gets its hashed name.
+        # The new names are written, then the rows pointed at them, and
+        # only then the old files deleted, so the pages never show a
+        # missing image and a run stopped half way can simply be run again
+        names = set(Listing.objects.values_list("image", flat=True))
+        for name in sorted(names):
+            if not name or CONTENT_ADDRESSED_NAME.search(name) or not self.storage.exists(name):
+                continue
+            new = content_name(name, self.hash_file(name))
+            if self.stored(new):
+                reclaimed += self.storage.size(name)
+            widths = set()
+            for listing in Listing.objects.filter(image=name).only("thumbnails"):
+                widths.update(width for width in listing.thumbnails.split(",") if width)
+            files = [(name, new)] + [
+                (variant_name(name, width, ext), variant_name(new, width, ext))
+                for width in widths for ext in (None, ".webp")
+                if self.storage.exists(variant_name(name, width, ext))
+            ]
+            handled.update(old for old, _ in files)
+            for old, copy in files:
+                self.place(old, copy)
+            listings = Listing.objects.filter(image=name)
+            if self.dry_run:
+                rewritten += listings.count()
+            else:
+                rewritten += listings.update(image=new, version=F("version") + 1)
+            for old, _ in files:
+                self.discard(old)
+            self.stdout.write(f"{name} -> {new}")
+
+        # Then the files no listing uses: a copy of bytes already stored
+        # under a hashed name goes, the first of any other bytes is given
+        # its hashed name, so the copies after it go too
+        directories = {os.path.dirname(name) for name in names if name} | {field.upload_to}
+        for directory in sorted(directories):
+            if not self.storage.exists(directory):
+                continue
+            for filename in sorted(self.storage.listdir(directory)[1]):
+                name = os.path.join(directory, filename)
+                if name in handled or CONTENT_ADDRESSED_NAME.search(name) or filename.startswith("."):
+                    continue
+                new = content_name(name, self.hash_file(name))
+                if self.stored(new):
+                    reclaimed += self.storage.size(name)
+                    self.stdout.write(f"{name}: duplicate")
+                else:
+                    self.place(name, new)
+                    self.stdout.write(f"{name} -> {new}")
+                self.discard(name)
+
+        if rewritten and not self.dry_run:
+            # The cards and pages show the images under their old names
+            purge()
+        self.stdout.write(self.style.SUCCESS(
+            f"Rewrote {rewritten} listings, reclaimed {reclaimed / 1024:.0f} KB"
+            + (" (dry run)" if self.dry_run else "")))
@@ -0,0 +1,33 @@
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+
+from auctions.synthetic import SCALES, generate
+
+
+class Command(BaseCommand):
+    help = "Fill the database with synthetic users, listings, bids, comments and watchlists."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--scale", choices=SCALES, default="small", help="Preset sizes, overridden by the options below")
+        for name in SCALES["small"]:
+            parser.add_argument(f"--{name}", type=int, default=None)
+        parser.add_argument("--seed", type=int, default=1)
+        parser.add_argument("--zipf", type=float, default=1.1, help="Exponent of the bid/comment popularity law")
+        parser.add_argument("--prefix", default="synthetic", help="Username prefix of the generated users")
+
+    def handle(self, *args, **options):
+        sizes = dict(SCALES[options["scale"]])
+        for name in sizes:
+            if options[name] is not None:
+                sizes[name] = options[name]
+        start = time.perf_counter()
+        try:
+            created = generate(**sizes, seed=options["seed"], exponent=options["zipf"],
+                               prefix=options["prefix"], log=self.stdout.write)
+        except ValueError as error:
+            raise CommandError(error)
+        self.stdout.write(self.style.SUCCESS(
+            f"Generated {', '.join(f'{count} {name}' for name, count in created.items())} "
+            f"in {time.perf_counter() - start:.1f}s"
+        ))
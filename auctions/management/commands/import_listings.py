@@ -0,0 +1,188 @@
+import csv
+import datetime
+import json
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+from itertools import islice
+
+from django.conf import settings
+from django.core.exceptions import ValidationError
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+from django.utils import timezone
+
+from auctions.models import Category, Listing, User
+from auctions.generations import purge
+from auctions.storage import ingest_image
+from auctions.views import ListingForm
+
+# pylint: disable=no-member
+
+
+# The rules of the create page; the image and category are checked
+# separately since they come as a path and a name
+ROW_FIELDS = {name: ListingForm.base_fields[name] for name in ("title", "description", "price", "duration")}
+
+
+def clean_row(row):
+    """The row's values cleaned by the ListingForm fields, and its errors.
+
+    Calls the fields directly: building a form per row deep-copies every
+    field and would cost more than the insert itself.
+    """
+    data = {}
+    errors = []
+    for name, field in ROW_FIELDS.items():
+        try:
+            data[name] = field.clean(row.get(name))
+        except ValidationError as error:
+            errors.append(f"{name}: {' '.join(error.messages)}")
+    return data, errors
+
+
+def read_rows(path):
+    with open(path, newline="", encoding="utf-8") as source:
+        if path.endswith((".jsonl", ".ndjson")):
+            for line in source:
+                if line.strip():
+                    yield json.loads(line)
+        else:
+            yield from csv.DictReader(source)
+
+
+def fingerprint(path):
+    """What tells an edited input file apart: its size and modification time."""
+    status = os.stat(path)
+    return [status.st_size, status.st_mtime_ns]
+
+
+def read_checkpoint(path, source):
+    """Rows of `source` an earlier run imported; refused if the file changed since."""
+    try:
+        with open(path) as checkpoint:
+            progress = json.load(checkpoint)
+    except FileNotFoundError:
+        return 0
+    if not isinstance(progress, dict) or progress.get("source") != fingerprint(source):
+        raise CommandError(f"{source} changed since the checkpoint {path} was written; "
+                           "pass --restart to import it from the start")
+    return progress["rows"]
+
+
+def write_checkpoint(path, source, done):
+    with open(path + ".tmp", "w") as checkpoint:
+        json.dump({"rows": done, "source": fingerprint(source)}, checkpoint)
+    os.replace(path + ".tmp", path)
+
+
+class Command(BaseCommand):
+    help = (
+        "Create listings in bulk from a CSV or JSONL file with title, description, "
+        "price, image, category, owner and optionally duration (days) columns."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("path")
+        parser.add_argument("--images", default=None, help="Directory image paths are relative to (default: the file's)")
+        parser.add_argument("--batch-size", type=int, default=2000, help="Rows written per transaction")
+        parser.add_argument("--workers", type=int, default=None, help="Image worker processes (default: one per CPU, 0: inline)")
+        parser.add_argument("--restart", action="store_true", help="Ignore the checkpoint of an earlier run")
+
+    def handle(self, *args, **options):
+        path = options["path"]
+        if not os.path.exists(path):
+            raise CommandError(f"No such file: {path}")
+        images = options["images"] or os.path.dirname(os.path.abspath(path))
+        checkpoint = path + ".progress"
+        done = 0 if options["restart"] else read_checkpoint(checkpoint, path)
+        if done:
+            self.stdout.write(f"Resuming after row {done}")
+
+        # One query each instead of one per row
+        owners = dict(User.objects.values_list("username", "id"))
+        categories = dict(Category.objects.values_list("name", "id"))
+        field = Listing._meta.get_field("image")
+        # Source path -> storage name, so a file used by many rows is read once
+        stored = {}
+        workers = os.cpu_count() if options["workers"] is None else options["workers"]
+        pool = ProcessPoolExecutor(max_workers=workers) if workers else None
+
+        rows = islice(read_rows(path), done, None)
+        imported = skipped = 0
+        start = time.perf_counter()
+        try:
+            while True:
+                batch = list(islice(rows, options["batch_size"]))
+                if not batch:
+                    break
+                listings, errors = self.build(batch, done, images, owners, categories, field, pool, stored)
+                for error in errors:
+                    self.stderr.write(error)
+                with transaction.atomic():
+                    Listing.objects.bulk_create(listings, batch_size=500)
+                # bulk_create sends no signals; the feeds show the new ones
+                purge()
+                # Only moved on once the batch is committed, so a failed run
+                # picks up at the first batch it did not write
+                done += len(batch)
+                write_checkpoint(checkpoint, path, done)
+                imported += len(listings)
+                skipped += len(errors)
+                elapsed = time.perf_counter() - start
+                self.stdout.write(f"Row {done}: {imported} imported, {imported / elapsed:.0f} rows/s")
+        finally:
+            if pool is not None:
+                pool.shutdown()
+
+        if os.path.exists(checkpoint):
+            os.remove(checkpoint)
+        elapsed = time.perf_counter() - start
+        self.stdout.write(self.style.SUCCESS(
+            f"Imported {imported} listings, skipped {skipped} rows in {elapsed:.1f}s "
+            f"({imported / max(elapsed, 1e-9):.0f} rows/s). Run make_thumbnails for their thumbnails."
+        ))
+
+    def build(self, batch, offset, images, owners, categories, field, pool, stored):
+        """Validate a batch and store its images; (listings, errors)."""
+        valid = []
+        errors = []
+        for number, row in enumerate(batch, offset + 1):
+            data, problems = clean_row(row)
+            owner = owners.get(row.get("owner"))
+            category = categories.get(row.get("category"))
+            if owner is None:
+                problems.append(f"unknown owner {row.get('owner')!r}")
+            if category is None:
+                problems.append(f"unknown category {row.get('category')!r}")
+            if not row.get("image"):
+                problems.append("image: This field is required.")
+            if problems:
+                errors.append(f"Row {number}: {'; '.join(problems)}")
+            else:
+                valid.append((number, data, owner, category, os.path.join(images, row["image"])))
+
+        sources = list({source for *_, source in valid if source not in stored})
+        arguments = (sources, [settings.MEDIA_ROOT] * len(sources), [field.upload_to] * len(sources))
+        results = pool.map(ingest_image, *arguments, chunksize=16) if pool else map(ingest_image, *arguments)
+        stored.update(zip(sources, results))
+
+        now = timezone.now()
+        listings = []
+        for number, data, owner, category, source in valid:
+            name, error = stored[source]
+            if error:
+                errors.append(f"Row {number}: {error}")
+                continue
+            duration = data["duration"]
+            listings.append(Listing(
+                title=data["title"],
+                description=data["description"],
+                price=data["price"],
+                image=name,
+                date=now,
+                ends_at=now + datetime.timedelta(days=duration) if duration else None,
+                owner_id=owner,
+                category_id=category,
+            ))
+        return listings, errors
@@ -0,0 +1,82 @@
+import asyncio
+import json
+import statistics
+import time
+import tracemalloc
+
+from django.core.management.base import BaseCommand
+
+from auctions.live import bid_event, hub, stream_listing
+
+ITEM_ID = 1
+
+
+async def measure(subscribers, rounds):
+    """Open `subscribers` idle streams on one listing and broadcast to them.
+
+    The streams are driven in-process through the ASGI interface, so the
+    numbers are those of the hub and the stream coroutines alone. Returns
+    the memory allocated per open stream and the broadcast latencies, the
+    time from publish until every stream has sent the event.
+    """
+    delivered = 0
+    target = subscribers
+    all_sent = asyncio.Event()
+    closing = asyncio.Event()
+
+    async def receive():
+        await closing.wait()
+        return {"type": "http.disconnect"}
+
+    async def send(message):
+        nonlocal delivered
+        if message.get("body", b"").startswith(b"data:"):
+            delivered += 1
+            if delivered == target:
+                all_sent.set()
+
+    tracemalloc.start()
+    before = tracemalloc.get_traced_memory()[0]
+    streams = [asyncio.ensure_future(stream_listing(receive, send, ITEM_ID)) for _ in range(subscribers)]
+    while hub.subscribers() < subscribers:
+        await asyncio.sleep(0)
+    # Let every stream reach its idle wait
+    await asyncio.sleep(0.1)
+    per_stream = (tracemalloc.get_traced_memory()[0] - before) / subscribers
+    tracemalloc.stop()
+
+    latencies = []
+    for n in range(rounds):
+        delivered = 0
+        all_sent.clear()
+        start = time.perf_counter()
+        hub.publish(bid_event(ITEM_ID, n, "benchmark"))
+        await all_sent.wait()
+        latencies.append(time.perf_counter() - start)
+
+    closing.set()
+    await asyncio.gather(*streams)
+    return {"subscribers": subscribers, "bytes_per_stream": round(per_stream), "latencies": latencies}
+
+
+class Command(BaseCommand):
+    help = "Measure memory per idle live bid stream and broadcast latency to all of them."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--subscribers", type=int, default=5000)
+        parser.add_argument("--rounds", type=int, default=20)
+        parser.add_argument("--json", action="store_true", help="Print the result as JSON")
+
+    def handle(self, *args, **options):
+        result = asyncio.run(measure(options["subscribers"], options["rounds"]))
+        latencies = sorted(result.pop("latencies"))
+        result["latency_ms"] = {
+            "p50": round(statistics.median(latencies) * 1000, 3),
+            "max": round(latencies[-1] * 1000, 3),
+        }
+        if options["json"]:
+            self.stdout.write(json.dumps(result))
+        else:
+            self.stdout.write(
+                f"{result['subscribers']} streams, {result['bytes_per_stream']} bytes each, "
+                f"broadcast p50 {result['latency_ms']['p50']} ms, max {result['latency_ms']['max']} ms")
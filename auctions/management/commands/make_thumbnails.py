@@ -0,0 +1,48 @@
+import os
+from concurrent.futures import ProcessPoolExecutor
+
+from django.core.management.base import BaseCommand
+from PIL import Image
+
+from auctions.models import Listing
+from auctions.thumbnails import render_variants, store_thumbnails, widths
+
+# pylint: disable=no-member
+
+
+class Command(BaseCommand):
+    help = "Generate the thumbnails and WebP copies of existing listing images in parallel."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--all", action="store_true", help="Redo listings that already have thumbnails")
+        parser.add_argument("--workers", type=int, default=None, help="Worker processes (default: one per CPU)")
+
+    def handle(self, *args, **options):
+        listings = Listing.objects.all()
+        if not options["all"]:
+            listings = listings.filter(thumbnails="")
+        # Several listings can share one file, render each file only once
+        by_name = {}
+        for pk, name in listings.values_list("pk", "image"):
+            by_name.setdefault(name, []).append(pk)
+        storage = Listing._meta.get_field("image").storage
+        names = [name for name in by_name if name and storage.exists(name)]
+        missing = len(by_name) - len(names)
+
+        failed = 0
+        with ProcessPoolExecutor(max_workers=options["workers"] or os.cpu_count()) as pool:
+            futures = [(name, pool.submit(render_variants, storage.path(name), widths())) for name in names]
+            for name, future in futures:
+                try:
+                    made = future.result()
+                except (OSError, SyntaxError, ValueError, Image.DecompressionBombError) as reason:
+                    # What PIL raises on unreadable, malformed and oversized
+                    # images; the other listings still get theirs
+                    failed += 1
+                    self.stderr.write(f"{name}: bad image: {reason}")
+                    continue
+                store_thumbnails(Listing.objects.filter(pk__in=by_name[name]), made)
+                self.stdout.write(f"{name}: {', '.join(str(width) for width in made) or 'already small'}")
+
+        self.stdout.write(self.style.SUCCESS(
+            f"Processed {len(names) - failed} images, {failed} unreadable, {missing} missing"))
@@ -0,0 +1,75 @@
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, transaction
+
+from auctions.triggers import FTS_INDEX, FTS_TRIGGERS, fts_table, fts_triggers
+
+# The index being built, and how far it has got: the highest listing id copied
+SHADOW = f"{FTS_INDEX}_new"
+PROGRESS = f"{FTS_INDEX}_progress"
+
+
+class Command(BaseCommand):
+    help = "Rebuild the full-text search index of listings in batches."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--batch-size", type=int, default=5000)
+
+    def handle(self, *args, **options):
+        if connection.vendor != "sqlite":
+            raise CommandError("The search index is an SQLite FTS5 table")
+        batch_size = options["batch_size"]
+        start = time.perf_counter()
+        # The new index is built next to the old one, which searches keep
+        # reading. Its triggers follow the listings it already holds, the
+        # batches copy the rest: one short transaction each, so bids and
+        # comments get the write lock in between
+        shadow_triggers = fts_triggers(SHADOW, copied=f"SELECT copied FROM {PROGRESS}")
+        with transaction.atomic(), connection.cursor() as cursor:
+            # Whatever a rebuild that did not finish left behind
+            for name in shadow_triggers:
+                cursor.execute(f"DROP TRIGGER IF EXISTS {name}")
+            cursor.execute(f"DROP TABLE IF EXISTS {SHADOW}")
+            cursor.execute(f"DROP TABLE IF EXISTS {PROGRESS}")
+            cursor.execute(fts_table(SHADOW))
+            cursor.execute(f"CREATE TABLE {PROGRESS} (copied integer NOT NULL)")
+            cursor.execute(f"INSERT INTO {PROGRESS} (copied) VALUES (0)")
+            for name, body in shadow_triggers.items():
+                cursor.execute(f"CREATE TRIGGER {name} {body}")
+
+        indexed = 0
+        while True:
+            with transaction.atomic(), connection.cursor() as cursor:
+                cursor.execute(
+                    "SELECT MAX(id), COUNT(*) FROM (SELECT id FROM auctions_listing "
+                    f"WHERE id > (SELECT copied FROM {PROGRESS}) ORDER BY id LIMIT %s)",
+                    [batch_size],
+                )
+                last_id, count = cursor.fetchone()
+                if not count:
+                    break
+                cursor.execute(
+                    f"INSERT INTO {SHADOW}(rowid, title, description) "
+                    "SELECT id, title, description FROM auctions_listing "
+                    f"WHERE id > (SELECT copied FROM {PROGRESS}) AND id <= %s",
+                    [last_id],
+                )
+                cursor.execute(f"UPDATE {PROGRESS} SET copied = %s", [last_id])
+            indexed += count
+            self.stdout.write(f"Indexed {indexed} listings")
+
+        # Every listing is in the new index: swap it in
+        with transaction.atomic(), connection.cursor() as cursor:
+            for name in list(shadow_triggers) + list(FTS_TRIGGERS):
+                cursor.execute(f"DROP TRIGGER IF EXISTS {name}")
+            cursor.execute(f"DROP TABLE {PROGRESS}")
+            cursor.execute(f"DROP TABLE IF EXISTS {FTS_INDEX}")
+            cursor.execute(f"ALTER TABLE {SHADOW} RENAME TO {FTS_INDEX}")
+            for name, body in FTS_TRIGGERS.items():
+                cursor.execute(f"CREATE TRIGGER {name} {body}")
+
+        with connection.cursor() as cursor:
+            cursor.execute(f"INSERT INTO {FTS_INDEX}({FTS_INDEX}) VALUES ('optimize')")
+        self.stdout.write(self.style.SUCCESS(
+            f"Indexed {indexed} listings in {time.perf_counter() - start:.1f}s"))
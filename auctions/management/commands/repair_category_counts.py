@@ -0,0 +1,35 @@
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.db.models import Count, Max, Q
+
+from auctions.generations import purge
+from auctions.models import Category, Listing
+
+# pylint: disable=no-member
+
+
+class Command(BaseCommand):
+    help = "Recompute the per-category listing counters from the listings."
+
+    def handle(self, *args, **options):
+        with transaction.atomic():
+            rollup = {
+                row["category"]: row
+                for row in Listing.objects.order_by().values("category").annotate(
+                    total=Count("id"),
+                    active=Count("id", filter=Q(on_sell=True)),
+                    latest=Max("date"),
+                )
+            }
+            categories = list(Category.objects.select_for_update())
+            changed = []
+            for category in categories:
+                row = rollup.get(category.id, {"total": 0, "active": 0, "latest": None})
+                counts = (row["active"], row["total"], row["latest"])
+                if counts != (category.active_count, category.total_count, category.latest_date):
+                    category.active_count, category.total_count, category.latest_date = counts
+                    changed.append(category)
+            Category.objects.bulk_update(changed, ["active_count", "total_count", "latest_date"], batch_size=500)
+            # The category page and the headers of theirs show the counts
+            purge(categories=[category.id for category in changed])
+        self.stdout.write(self.style.SUCCESS(f"Checked {len(categories)} categories, fixed {len(changed)}"))
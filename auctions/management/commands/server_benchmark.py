@@ -0,0 +1,178 @@
+import asyncio
+import io
+import json
+import sys
+import threading
+import time
+
+from django.conf import settings
+from django.core.handlers.wsgi import WSGIHandler
+from django.core.management.base import BaseCommand
+from django.test import Client
+from django.urls import reverse
+
+from auctions.synthetic import SCALES
+
+from .benchmark import generated_database, meta, percentile
+
+# pylint: disable=no-member
+
+
+def page_paths(fixture):
+    """The pages the async views serve, in the order each connection requests them."""
+    return [
+        reverse("index"),
+        reverse("details", args=(fixture.item.id,)),
+        reverse("all"),
+        reverse("category"),
+        reverse("searchCategory", args=(fixture.item.category_id,)),
+        reverse("watchlist"),
+    ]
+
+
+def session_cookie(fixture):
+    client = Client()
+    client.force_login(fixture.user)
+    return f"{settings.SESSION_COOKIE_NAME}={client.cookies[settings.SESSION_COOKIE_NAME].value}"
+
+
+def summarize(latencies, statuses, elapsed):
+    return {
+        "requests": len(latencies),
+        "requests_per_second": round(len(latencies) / elapsed, 1),
+        "p50_ms": round(percentile(latencies, 0.50) * 1000, 3),
+        "p99_ms": round(percentile(latencies, 0.99) * 1000, 3),
+        "errors": sum(1 for status in statuses if status != 200),
+    }
+
+
+def run_wsgi(paths, cookie, connections, requests, threads):
+    """`connections` clients in a row each against a WSGI server of `threads` threads.
+
+    A client waits for a free server thread like a connection waits in a
+    threaded WSGI server's accept queue; the wait counts in its latency.
+    """
+    application = WSGIHandler()
+    server = threading.Semaphore(threads)
+    latencies = []
+    statuses = []
+
+    def client(number):
+        for n in range(requests):
+            path = paths[(number + n) % len(paths)]
+            environ = {
+                "REQUEST_METHOD": "GET", "PATH_INFO": path, "QUERY_STRING": "", "SCRIPT_NAME": "",
+                "SERVER_NAME": "testserver", "SERVER_PORT": "80", "HTTP_HOST": "testserver",
+                "REMOTE_ADDR": "127.0.0.1", "HTTP_COOKIE": cookie, "SERVER_PROTOCOL": "HTTP/1.1",
+                "wsgi.input": io.BytesIO(), "wsgi.errors": sys.stderr, "wsgi.url_scheme": "http",
+                "wsgi.version": (1, 0), "wsgi.multithread": True, "wsgi.multiprocess": False,
+                "wsgi.run_once": False,
+            }
+            status = []
+            start = time.perf_counter()
+            with server:
+                body = application(environ, lambda line, headers, exc_info=None: status.append(line))
+                try:
+                    for _ in body:
+                        pass
+                finally:
+                    body.close()
+            latencies.append(time.perf_counter() - start)
+            statuses.append(int(status[0].split()[0]))
+
+    clients = [threading.Thread(target=client, args=(n,)) for n in range(connections)]
+    start = time.perf_counter()
+    for thread in clients:
+        thread.start()
+    for thread in clients:
+        thread.join()
+    return summarize(latencies, statuses, time.perf_counter() - start)
+
+
+def run_asgi(paths, cookie, connections, requests):
+    """`connections` clients in a row each against commerce.asgi, all on one event loop."""
+    from commerce.asgi import application
+
+    latencies = []
+    statuses = []
+
+    async def receive():
+        return {"type": "http.request", "body": b"", "more_body": False}
+
+    async def client(number):
+        for n in range(requests):
+            path = paths[(number + n) % len(paths)]
+            scope = {
+                "type": "http", "asgi": {"version": "3.0"}, "http_version": "1.1", "method": "GET",
+                "scheme": "http", "path": path, "raw_path": path.encode(), "query_string": b"",
+                "root_path": "", "client": ("127.0.0.1", 50000 + number), "server": ("testserver", 80),
+                "headers": [(b"host", b"testserver"), (b"cookie", cookie.encode())],
+            }
+            status = []
+
+            async def send(message):
+                if message["type"] == "http.response.start":
+                    status.append(message["status"])
+
+            start = time.perf_counter()
+            await application(scope, receive, send)
+            latencies.append(time.perf_counter() - start)
+            statuses.append(status[0])
+
+    async def main():
+        await asyncio.gather(*(client(n) for n in range(connections)))
+
+    start = time.perf_counter()
+    asyncio.run(main())
+    return summarize(latencies, statuses, time.perf_counter() - start)
+
+
+class Command(BaseCommand):
+    help = (
+        "Compare the throughput of the read-heavy pages served through WSGI (sync views, "
+        "a thread per request) and ASGI (async views) at several numbers of concurrent "
+        "connections, on one generated dataset."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--scale", choices=SCALES, default="small", help="Size of the generated dataset")
+        parser.add_argument("--seed", type=int, default=1)
+        parser.add_argument("--connections", type=int, nargs="+", default=[1, 8, 32, 128],
+                            help="Concurrent connections to try")
+        parser.add_argument("--requests", type=int, default=30, help="Requests per connection")
+        parser.add_argument("--threads", type=int, help="WSGI server threads (default: ASYNC_VIEW_THREADS)")
+        parser.add_argument("--output", help="Write the JSON report here (default: stdout)")
+
+    def handle(self, *args, **options):
+        threads = options["threads"] or getattr(settings, "ASYNC_VIEW_THREADS", 8)
+        results = []
+        with generated_database(options["scale"], options["seed"], self.stderr.write) as fixture:
+            paths = page_paths(fixture)
+            cookie = session_cookie(fixture)
+            # Warm the caches, the templates and both handlers
+            run_wsgi(paths, cookie, 1, len(paths), threads)
+            run_asgi(paths, cookie, 1, len(paths))
+            for connections in options["connections"]:
+                for server, run in (
+                    ("wsgi", lambda: run_wsgi(paths, cookie, connections, options["requests"], threads)),
+                    ("asgi", lambda: run_asgi(paths, cookie, connections, options["requests"])),
+                ):
+                    result = dict(run(), server=server, connections=connections)
+                    results.append(result)
+                    self.stderr.write(
+                        f"{server} {connections:4} connections: {result['requests_per_second']:8.1f} req/s, "
+                        f"p50 {result['p50_ms']:8.2f} ms, p99 {result['p99_ms']:8.2f} ms, "
+                        f"{result['errors']} errors"
+                    )
+
+        report = {
+            "meta": meta(scale=options["scale"], seed=options["seed"], requests=options["requests"],
+                         threads=threads, paths=paths),
+            "results": results,
+        }
+        text = json.dumps(report, indent=2, sort_keys=True)
+        if options["output"]:
+            with open(options["output"], "w") as output:
+                output.write(text + "\n")
+        else:
+            self.stdout.write(text)
@@ -0,0 +1,63 @@
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.db.models import Count, Max, OuterRef, Subquery
+
+from auctions.models import Bid, Listing
+
+# pylint: disable=no-member
+
+
+class Command(BaseCommand):
+    help = "Check the top-bid projection of every listing against its bids."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--fix", action="store_true", help="Rewrite the listings that disagree")
+        parser.add_argument("--chunk-size", type=int, default=2000)
+
+    def handle(self, *args, **options):
+        checked = drifted = 0
+        last_id = 0
+        # One chunk of listings, and their bids, in memory and in a
+        # transaction at a time
+        while True:
+            with transaction.atomic():
+                chunk = self.check_chunk(last_id, options["chunk_size"], options["fix"])
+            if not chunk:
+                break
+            last_id, chunk_checked, chunk_drifted = chunk
+            checked += chunk_checked
+            drifted += chunk_drifted
+        verb = "fixed" if options["fix"] else "found"
+        self.stdout.write(self.style.SUCCESS(f"Checked {checked} listings, {verb} {drifted} out of sync"))
+
+    def check_chunk(self, last_id, size, fix):
+        """Check the `size` listings after `last_id`: (last id, checked, out of sync), None past the end."""
+        listings = Listing.objects.filter(id__gt=last_id).order_by("id").only(
+            "actual_bid", "bid_count", "leading_bidder", "price")
+        if fix:
+            listings = listings.select_for_update()
+        listings = list(listings[:size])
+        if not listings:
+            return None
+        top = Bid.objects.filter(item=OuterRef("item")).order_by("-amount", "-id")
+        rollup = {
+            row["item"]: row
+            for row in Bid.objects.filter(item__gt=last_id, item__lte=listings[-1].id)
+            .order_by().values("item").annotate(
+                count=Count("id"),
+                amount=Max("amount"),
+                buyer=Subquery(top.values("buyer")[:1]),
+            )
+        }
+        drifted = []
+        for listing in listings:
+            row = rollup.get(listing.id, {"count": 0, "amount": None, "buyer": None})
+            expected = (row["amount"] or 0, row["count"], row["buyer"])
+            actual = (listing.actual_bid, listing.bid_count, listing.leading_bidder_id)
+            if expected != actual:
+                self.stdout.write(f"Listing {listing.id}: {actual} should be {expected}")
+                listing.actual_bid, listing.bid_count, listing.leading_bidder_id = expected
+                drifted.append(listing)
+        if fix:
+            Listing.objects.bulk_update(drifted, ["actual_bid", "bid_count", "leading_bidder"], batch_size=500)
+        return listings[-1].id, len(listings), len(drifted)
@@ -0,0 +1,222 @@
+"""Per view request metrics, exported at /metrics in the Prometheus text format.
+
+MetricsMiddleware times every request and every query it runs, on any
+thread; TimedDjangoTemplates adds the time spent rendering
+templates. Each request then takes one lock to add its numbers to fixed
+bucket histograms, so the cost is a few function calls per query and per
+request. The histograms are per process: with several workers, scrape each
+one (or tell them apart by instance label).
+
+Requests slower than SLOW_REQUEST_SECONDS are logged to "auctions.slow"
+with their slowest queries.
+"""
+import asyncio
+import contextvars
+import logging
+import threading
+import time
+from bisect import bisect_left
+
+from django.conf import settings
+from django.http import HttpResponse, HttpResponseForbidden
+from django.template.backends.django import DjangoTemplates, Template
+
+from .throttling import counters as throttle_counters
+
+logger = logging.getLogger("auctions.slow")
+
+# Queries shown in a slow request log line
+SLOW_QUERIES_LOGGED = 5
+
+SECONDS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+
+# name: (help, bucket upper bounds)
+HISTOGRAMS = {
+    "auctions_request_seconds": ("Wall time of the request", SECONDS),
+    "auctions_db_queries": ("Database queries per request", (0, 1, 2, 3, 5, 10, 20, 50, 100, 500)),
+    "auctions_db_seconds": ("Time spent in database queries per request", SECONDS),
+    "auctions_template_seconds": ("Time spent rendering templates per request", SECONDS),
+    "auctions_response_bytes": ("Size of the response body", (256, 1024, 4096, 16384, 65536, 262144, 1048576)),
+}
+
+# The request being measured on this thread or task
+current = contextvars.ContextVar("current", default=None)
+
+
+class Histogram:
+
+    def __init__(self, bounds):
+        self.bounds = bounds
+        self.counts = [0] * (len(bounds) + 1)
+        self.sum = 0
+
+    def observe(self, value):
+        self.counts[bisect_left(self.bounds, value)] += 1
+        self.sum += value
+
+
+class Registry:
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        # name -> view -> Histogram
+        self.histograms = {name: {} for name in HISTOGRAMS}
+
+    def observe(self, view, values):
+        with self.lock:
+            for name, value in values.items():
+                histogram = self.histograms[name].get(view)
+                if histogram is None:
+                    histogram = self.histograms[name][view] = Histogram(HISTOGRAMS[name][1])
+                histogram.observe(value)
+
+    def render(self):
+        lines = []
+        with self.lock:
+            for name, (description, _) in HISTOGRAMS.items():
+                lines.append(f"# HELP {name} {description}")
+                lines.append(f"# TYPE {name} histogram")
+                for view, histogram in sorted(self.histograms[name].items()):
+                    label = f'view="{escape(view)}"'
+                    total = 0
+                    for bound, count in zip(histogram.bounds + ("+Inf",), histogram.counts):
+                        total += count
+                        lines.append(f'{name}_bucket{{{label},le="{bound}"}} {total}')
+                    lines.append(f"{name}_sum{{{label}}} {histogram.sum}")
+                    lines.append(f"{name}_count{{{label}}} {total}")
+        lines.append("# HELP auctions_throttle_requests_total Requests to budgeted routes by outcome")
+        lines.append("# TYPE auctions_throttle_requests_total counter")
+        for (route, outcome), total in sorted(throttle_counters().items()):
+            lines.append(f'auctions_throttle_requests_total{{route="{escape(route)}",outcome="{outcome}"}} {total}')
+        return "\n".join(lines) + "\n"
+
+
+def escape(value):
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+registry = Registry()
+
+
+class Measurement:
+    __slots__ = ("queries", "db_time", "template_time")
+
+    def __init__(self):
+        # (seconds, sql) of every query
+        self.queries = []
+        self.db_time = 0
+        self.template_time = 0
+
+    def __call__(self, execute, sql, params, many, context):
+        # connection.execute_wrapper hook
+        start = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            elapsed = time.perf_counter() - start
+            self.db_time += elapsed
+            self.queries.append((elapsed, sql))
+
+
+def measure_query(execute, sql, params, many, context):
+    # Installed on every connection; the request being measured is found
+    # through the context, which sync_to_async and the async views' thread
+    # pool carry over to the thread running the query
+    measurement = current.get()
+    if measurement is None:
+        return execute(sql, params, many, context)
+    return measurement(execute, sql, params, many, context)
+
+
+def install_query_hook(sender, connection, **kwargs):
+    # connection_created receiver; the list outlives reconnections
+    if measure_query not in connection.execute_wrappers:
+        connection.execute_wrappers.append(measure_query)
+
+
+class TimedTemplate(Template):
+
+    def render(self, context=None, request=None):
+        measurement = current.get()
+        if measurement is None:
+            return super().render(context, request)
+        start = time.perf_counter()
+        try:
+            return super().render(context, request)
+        finally:
+            measurement.template_time += time.perf_counter() - start
+
+
+class TimedDjangoTemplates(DjangoTemplates):
+    """The Django template backend, timing renders for MetricsMiddleware."""
+
+    def from_string(self, template_code):
+        return TimedTemplate(super().from_string(template_code).template, self)
+
+    def get_template(self, template_name):
+        return TimedTemplate(super().get_template(template_name).template, self)
+
+
+class MetricsMiddleware:
+    """Goes first in MIDDLEWARE so that the others are measured too."""
+
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if asyncio.iscoroutinefunction(get_response):
+            # How Django's MiddlewareMixin marks itself async
+            self._is_coroutine = asyncio.coroutines._is_coroutine
+
+    def __call__(self, request):
+        if asyncio.iscoroutinefunction(self.get_response):
+            return self.__acall__(request)
+        measurement = Measurement()
+        token = current.set(measurement)
+        start = time.perf_counter()
+        try:
+            response = self.get_response(request)
+        finally:
+            current.reset(token)
+        self.record(request, response, measurement, time.perf_counter() - start)
+        return response
+
+    async def __acall__(self, request):
+        measurement = Measurement()
+        token = current.set(measurement)
+        start = time.perf_counter()
+        try:
+            response = await self.get_response(request)
+        finally:
+            current.reset(token)
+        self.record(request, response, measurement, time.perf_counter() - start)
+        return response
+
+    def record(self, request, response, measurement, elapsed):
+        match = request.resolver_match
+        view = (match.url_name or match.view_name) if match else "unmatched"
+        values = {
+            "auctions_request_seconds": elapsed,
+            "auctions_db_queries": len(measurement.queries),
+            "auctions_db_seconds": measurement.db_time,
+            "auctions_template_seconds": measurement.template_time,
+        }
+        if not response.streaming:
+            values["auctions_response_bytes"] = len(response.content)
+        registry.observe(view, values)
+
+        if elapsed >= getattr(settings, "SLOW_REQUEST_SECONDS", 0.5):
+            slowest = sorted(measurement.queries, reverse=True)[:SLOW_QUERIES_LOGGED]
+            logger.warning(
+                "Slow request %s %s (%s): %.3fs, %d queries in %.3fs, templates %.3fs%s",
+                request.method, request.path, view, elapsed, len(measurement.queries),
+                measurement.db_time, measurement.template_time,
+                "".join(f"\n  {seconds * 1000:.1f}ms {sql}" for seconds, sql in slowest),
+            )
+
+
+def metrics(request):
+    if request.META.get("REMOTE_ADDR") not in getattr(settings, "METRICS_ALLOWED_IPS", ("127.0.0.1",)):
+        return HttpResponseForbidden()
+    return HttpResponse(registry.render(), content_type="text/plain; version=0.0.4")
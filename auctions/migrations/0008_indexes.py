@@ -0,0 +1,51 @@
+# Generated by Django 3.1.14 on 2026-10-18 19:24
+
+from django.db import migrations, models
+
+
+def remove_duplicate_watchlist_rows(apps, schema_editor):
+    # Keep the oldest row of every (user, item) pair so the unique
+    # constraint below can be created
+    Watchlist = apps.get_model('auctions', 'Watchlist')
+    seen = set()
+    duplicates = []
+    for pk, user_id, item_id in Watchlist.objects.order_by('pk').values_list('pk', 'user_id', 'item_id'):
+        if (user_id, item_id) in seen:
+            duplicates.append(pk)
+        seen.add((user_id, item_id))
+    Watchlist.objects.filter(pk__in=duplicates).delete()
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('auctions', '0007_auto_20210402_1015'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='bid',
+            index=models.Index(fields=['item', '-amount'], name='bid_item_amount_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='comment',
+            index=models.Index(fields=['item', '-date'], name='comment_item_date_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='listing',
+            index=models.Index(fields=['-date', '-id'], name='listing_date_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='listing',
+            index=models.Index(condition=models.Q(on_sell=True), fields=['-date', '-id'], name='listing_on_sell_date_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='listing',
+            index=models.Index(condition=models.Q(on_sell=True), fields=['category', '-date', '-id'], name='listing_category_date_idx'),
+        ),
+        migrations.RunPython(remove_duplicate_watchlist_rows, migrations.RunPython.noop),
+        migrations.AddConstraint(
+            model_name='watchlist',
+            constraint=models.UniqueConstraint(fields=('user', 'item'), name='watchlist_user_item_unique'),
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 3.1.14 on 2026-10-18 19:28
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('auctions', '0009_listing_version'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='listing',
+            name='thumbnails',
+            field=models.CharField(blank=True, default='', max_length=64),
+        ),
+    ]
@@ -0,0 +1,19 @@
+# Generated by Django 3.1.14 on 2026-10-18 19:30
+
+import auctions.storage
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('auctions', '0010_listing_thumbnails'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='listing',
+            name='image',
+            field=models.ImageField(storage=auctions.storage.ContentAddressedStorage(), upload_to='items'),
+        ),
+    ]
@@ -0,0 +1,109 @@
+# Generated by Django 3.1.14 on 2026-10-18 19:35
+
+from django.db import migrations, models
+
+# Category.active_count, total_count and latest_date follow the listings
+# through triggers on auctions_listing. Frozen here: later migrations that
+# rebuild auctions_listing reinstall them from this list.
+TRIGGERS = [
+    """
+    CREATE TRIGGER auctions_category_counts_insert AFTER INSERT ON auctions_listing BEGIN
+        UPDATE auctions_category SET
+            total_count = total_count + 1,
+            active_count = active_count + new.on_sell,
+            latest_date = CASE WHEN latest_date IS NULL OR new.date > latest_date
+                               THEN new.date ELSE latest_date END
+        WHERE id = new.category_id;
+    END
+    """,
+    """
+    CREATE TRIGGER auctions_category_counts_delete AFTER DELETE ON auctions_listing BEGIN
+        UPDATE auctions_category SET
+            total_count = total_count - 1,
+            active_count = active_count - old.on_sell,
+            latest_date = (SELECT MAX(date) FROM auctions_listing WHERE category_id = old.category_id)
+        WHERE id = old.category_id;
+    END
+    """,
+    """
+    CREATE TRIGGER auctions_category_counts_sell AFTER UPDATE OF on_sell ON auctions_listing
+    WHEN old.category_id IS new.category_id AND old.on_sell IS NOT new.on_sell BEGIN
+        UPDATE auctions_category SET active_count = active_count + new.on_sell - old.on_sell
+        WHERE id = new.category_id;
+    END
+    """,
+    """
+    CREATE TRIGGER auctions_category_counts_move AFTER UPDATE OF category_id ON auctions_listing
+    WHEN old.category_id IS NOT new.category_id BEGIN
+        UPDATE auctions_category SET
+            total_count = total_count - 1,
+            active_count = active_count - old.on_sell,
+            latest_date = (SELECT MAX(date) FROM auctions_listing WHERE category_id = old.category_id)
+        WHERE id = old.category_id;
+        UPDATE auctions_category SET
+            total_count = total_count + 1,
+            active_count = active_count + new.on_sell,
+            latest_date = (SELECT MAX(date) FROM auctions_listing WHERE category_id = new.category_id)
+        WHERE id = new.category_id;
+    END
+    """,
+    """
+    CREATE TRIGGER auctions_category_counts_date AFTER UPDATE OF date ON auctions_listing
+    WHEN old.category_id IS new.category_id AND old.date IS NOT new.date BEGIN
+        UPDATE auctions_category SET
+            latest_date = (SELECT MAX(date) FROM auctions_listing WHERE category_id = new.category_id)
+        WHERE id = new.category_id;
+    END
+    """,
+]
+
+REPAIR = """
+    UPDATE auctions_category SET
+        total_count = (SELECT COUNT(*) FROM auctions_listing WHERE category_id = auctions_category.id),
+        active_count = (SELECT COUNT(*) FROM auctions_listing
+                        WHERE category_id = auctions_category.id AND on_sell),
+        latest_date = (SELECT MAX(date) FROM auctions_listing WHERE category_id = auctions_category.id)
+"""
+
+DROP = [
+    "DROP TRIGGER IF EXISTS auctions_category_counts_date",
+    "DROP TRIGGER IF EXISTS auctions_category_counts_move",
+    "DROP TRIGGER IF EXISTS auctions_category_counts_sell",
+    "DROP TRIGGER IF EXISTS auctions_category_counts_delete",
+    "DROP TRIGGER IF EXISTS auctions_category_counts_insert",
+]
+
+
+def run(statements):
+    def operation(apps, schema_editor):
+        # Triggers here are written for SQLite
+        if schema_editor.connection.vendor == 'sqlite':
+            for statement in statements:
+                schema_editor.execute(statement)
+    return operation
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('auctions', '0012_listing_search'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='category',
+            name='active_count',
+            field=models.PositiveIntegerField(default=0, editable=False),
+        ),
+        migrations.AddField(
+            model_name='category',
+            name='latest_date',
+            field=models.DateTimeField(blank=True, editable=False, null=True),
+        ),
+        migrations.AddField(
+            model_name='category',
+            name='total_count',
+            field=models.PositiveIntegerField(default=0, editable=False),
+        ),
+        migrations.RunPython(run(TRIGGERS + [REPAIR]), run(DROP)),
+    ]
@@ -0,0 +1,42 @@
+# Generated by Django 3.1.14 on 2026-10-18 19:37
+
+from importlib import import_module
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+# The frozen trigger SQL of the earlier migrations
+search = import_module('auctions.migrations.0012_listing_search')
+counts = import_module('auctions.migrations.0013_category_counts')
+
+# Every trigger on auctions_listing so far (0012's without its table and
+# rebuild). Adding a field rebuilds the table, which drops them
+TRIGGERS = search.CREATE[1:4] + counts.TRIGGERS
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('auctions', '0013_category_counts'),
+    ]
+
+    operations = [
+        # Unapplying rebuilds auctions_listing too; this runs last then
+        migrations.RunPython(migrations.RunPython.noop, counts.run(TRIGGERS)),
+        migrations.AddField(
+            model_name='listing',
+            name='ends_at',
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='listing',
+            name='winning_bid',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='+', to='auctions.bid'),
+        ),
+        migrations.AddIndex(
+            model_name='listing',
+            index=models.Index(condition=models.Q(('ends_at__isnull', False), ('on_sell', True)), fields=['ends_at'], name='listing_due_idx'),
+        ),
+        # Adding the fields rebuilt auctions_listing without its triggers
+        migrations.RunPython(counts.run(TRIGGERS), migrations.RunPython.noop),
+    ]
@@ -0,0 +1,67 @@
+# Generated by Django 3.1.14 on 2026-10-18 19:38
+
+from importlib import import_module
+
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+from django.db.models import Count, OuterRef, Subquery
+from django.db.models.functions import Coalesce
+import django.utils.timezone
+
+counts = import_module('auctions.migrations.0013_category_counts')
+timed = import_module('auctions.migrations.0014_timed_auctions')
+
+# The triggers on auctions_listing, unchanged here but dropped by the rebuild
+TRIGGERS = timed.TRIGGERS
+
+
+def backfill_projection(apps, schema_editor):
+    Listing = apps.get_model('auctions', 'Listing')
+    Bid = apps.get_model('auctions', 'Bid')
+    bids = Bid.objects.filter(item=OuterRef('pk')).order_by()
+    top = bids.order_by('-amount', '-pk')
+    # actual_bid too: older rows could disagree with their top bid
+    Listing.objects.update(
+        actual_bid=Coalesce(Subquery(top.values('amount')[:1]), 0),
+        bid_count=Coalesce(Subquery(bids.values('item').annotate(count=Count('pk')).values('count')), 0),
+        leading_bidder=Subquery(top.values('buyer')[:1]),
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('auctions', '0014_timed_auctions'),
+    ]
+
+    operations = [
+        # Unapplying rebuilds auctions_listing too; this runs last then
+        migrations.RunPython(migrations.RunPython.noop, counts.run(TRIGGERS)),
+        migrations.RemoveIndex(
+            model_name='bid',
+            name='bid_item_amount_idx',
+        ),
+        migrations.AddField(
+            model_name='bid',
+            name='date',
+            field=models.DateTimeField(default=django.utils.timezone.now),
+        ),
+        migrations.AddField(
+            model_name='listing',
+            name='bid_count',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='listing',
+            name='leading_bidder',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='+', to=settings.AUTH_USER_MODEL),
+        ),
+        migrations.AddIndex(
+            model_name='bid',
+            index=models.Index(fields=['item', '-amount', '-id'], name='bid_item_amount_idx'),
+        ),
+        migrations.RunPython(backfill_projection, migrations.RunPython.noop),
+        # Adding the fields rebuilt auctions_listing without its triggers
+        migrations.RunPython(counts.run(TRIGGERS), migrations.RunPython.noop),
+    ]
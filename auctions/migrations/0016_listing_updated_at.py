@@ -0,0 +1,44 @@
+# Generated by Django 3.1.14 on 2026-10-18 19:43
+
+from importlib import import_module
+
+from django.db import migrations, models
+
+counts = import_module('auctions.migrations.0013_category_counts')
+projection = import_module('auctions.migrations.0015_bid_projection')
+
+# Stamps updated_at on every update that does not set it itself. Written
+# the way Django stores datetimes on SQLite (UTC, microseconds), so stamped
+# and ORM-written values compare correctly as text
+TOUCH = """
+    CREATE TRIGGER auctions_listing_touch AFTER UPDATE ON auctions_listing
+    WHEN new.updated_at IS old.updated_at BEGIN
+        UPDATE auctions_listing SET updated_at = strftime('%Y-%m-%d %H:%M:%f000', 'now')
+        WHERE id = new.id;
+    END
+"""
+
+TRIGGERS = projection.TRIGGERS + [TOUCH]
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('auctions', '0015_bid_projection'),
+    ]
+
+    operations = [
+        # Unapplying rebuilds auctions_listing too; this runs last then
+        migrations.RunPython(migrations.RunPython.noop, counts.run(projection.TRIGGERS)),
+        migrations.AddField(
+            model_name='listing',
+            name='updated_at',
+            field=models.DateTimeField(auto_now=True),
+        ),
+        migrations.AddIndex(
+            model_name='listing',
+            index=models.Index(fields=['updated_at', 'id'], name='listing_updated_idx'),
+        ),
+        # Puts back the triggers the rebuild dropped and adds the updated_at one
+        migrations.RunPython(counts.run(TRIGGERS), migrations.RunPython.noop),
+    ]
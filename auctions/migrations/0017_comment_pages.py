@@ -0,0 +1,64 @@
+# Generated by Django 3.1.14 on 2026-10-18 20:03
+
+from importlib import import_module
+
+from django.db import migrations, models
+
+counts = import_module('auctions.migrations.0013_category_counts')
+updated = import_module('auctions.migrations.0016_listing_updated_at')
+
+# Unchanged on auctions_listing, dropped by its rebuild
+TRIGGERS = updated.TRIGGERS
+
+# Listing.comment_count follows inserts and deletes on auctions_comment
+COMMENT_COUNT_TRIGGERS = [
+    """
+    CREATE TRIGGER auctions_comment_count_insert AFTER INSERT ON auctions_comment BEGIN
+        UPDATE auctions_listing SET comment_count = comment_count + 1 WHERE id = new.item_id;
+    END
+    """,
+    """
+    CREATE TRIGGER auctions_comment_count_delete AFTER DELETE ON auctions_comment BEGIN
+        UPDATE auctions_listing SET comment_count = comment_count - 1 WHERE id = old.item_id;
+    END
+    """,
+]
+
+COMMENT_COUNT_REPAIR = """
+    UPDATE auctions_listing SET
+        comment_count = (SELECT COUNT(*) FROM auctions_comment WHERE item_id = auctions_listing.id)
+"""
+
+DROP_COMMENT_COUNT_TRIGGERS = [
+    "DROP TRIGGER IF EXISTS auctions_comment_count_delete",
+    "DROP TRIGGER IF EXISTS auctions_comment_count_insert",
+]
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('auctions', '0016_listing_updated_at'),
+    ]
+
+    operations = [
+        # Unapplying rebuilds auctions_listing too; this runs last then
+        migrations.RunPython(migrations.RunPython.noop, counts.run(TRIGGERS)),
+        migrations.RemoveIndex(
+            model_name='comment',
+            name='comment_item_date_idx',
+        ),
+        migrations.AddField(
+            model_name='listing',
+            name='comment_count',
+            field=models.PositiveIntegerField(default=0, editable=False),
+        ),
+        migrations.AddIndex(
+            model_name='comment',
+            index=models.Index(fields=['item', '-date', '-id'], name='comment_item_page_idx'),
+        ),
+        # Puts back the triggers the listing rebuild dropped, then counts
+        migrations.RunPython(counts.run(TRIGGERS), migrations.RunPython.noop),
+        migrations.RunPython(counts.run(COMMENT_COUNT_TRIGGERS + [COMMENT_COUNT_REPAIR]),
+                             counts.run(DROP_COMMENT_COUNT_TRIGGERS)),
+    ]
@@ -0,0 +1,69 @@
+# Generated by Django 3.1.14 on 2026-10-18 20:57
+
+from importlib import import_module
+
+from django.db import migrations, models
+
+counts = import_module('auctions.migrations.0013_category_counts')
+
+# Each insert, update and delete of a listing gives it a new sequence
+# number in auctions_listingchange, in the writing transaction, which the
+# API changes feed pages through. INSERT OR REPLACE keeps one row per
+# listing, its last change
+CHANGE_LOG_TRIGGERS = [
+    """
+    CREATE TRIGGER auctions_listing_change_insert AFTER INSERT ON auctions_listing BEGIN
+        INSERT OR REPLACE INTO auctions_listingchange (listing_id, deleted, changed_at)
+        VALUES (new.id, 0, strftime('%Y-%m-%d %H:%M:%f000', 'now'));
+    END
+    """,
+    """
+    CREATE TRIGGER auctions_listing_change_update AFTER UPDATE ON auctions_listing BEGIN
+        INSERT OR REPLACE INTO auctions_listingchange (listing_id, deleted, changed_at)
+        VALUES (new.id, 0, strftime('%Y-%m-%d %H:%M:%f000', 'now'));
+    END
+    """,
+    """
+    CREATE TRIGGER auctions_listing_change_delete AFTER DELETE ON auctions_listing BEGIN
+        INSERT OR REPLACE INTO auctions_listingchange (listing_id, deleted, changed_at)
+        VALUES (old.id, 1, strftime('%Y-%m-%d %H:%M:%f000', 'now'));
+    END
+    """,
+]
+
+# The listings there are, in the order they last changed
+BACKFILL = """
+    INSERT INTO auctions_listingchange (listing_id, deleted, changed_at)
+    SELECT id, 0, updated_at FROM auctions_listing ORDER BY updated_at, id
+"""
+
+DROP_CHANGE_LOG_TRIGGERS = [
+    "DROP TRIGGER IF EXISTS auctions_listing_change_delete",
+    "DROP TRIGGER IF EXISTS auctions_listing_change_update",
+    "DROP TRIGGER IF EXISTS auctions_listing_change_insert",
+]
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('auctions', '0017_comment_pages'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ListingChange',
+            fields=[
+                ('seq', models.AutoField(primary_key=True, serialize=False)),
+                ('listing_id', models.IntegerField(unique=True)),
+                ('deleted', models.BooleanField(default=False)),
+                ('changed_at', models.DateTimeField()),
+            ],
+        ),
+        # The changes feed paged through it; nothing reads it any more
+        migrations.RemoveIndex(
+            model_name='listing',
+            name='listing_updated_idx',
+        ),
+        migrations.RunPython(counts.run(CHANGE_LOG_TRIGGERS + [BACKFILL]), counts.run(DROP_CHANGE_LOG_TRIGGERS)),
+    ]
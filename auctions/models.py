@@ -1,12 +1,27 @@
 from django.contrib.auth.models import AbstractUser
 from django.db import models
+from django.utils import timezone
+
+from .storage import ContentAddressedStorage
+from .thumbnails import variant_name
 
 
 class User(AbstractUser):
-    pass
+
+    def get_session_auth_hash(self):
+        # A user read from the sessions cache comes without its password,
+        # and with the hash made from it (auth.py)
+        if "password" in self.get_deferred_fields() and hasattr(self, "session_auth_hash"):
+            return self.session_auth_hash
+        return super().get_session_auth_hash()
 
 class Category(models.Model):
     name = models.CharField(max_length=25, blank=True)
+    # Kept up to date by triggers on auctions_listing (migration 0013),
+    # recomputed by manage.py repair_category_counts
+    active_count = models.PositiveIntegerField(default=0, editable=False)
+    total_count = models.PositiveIntegerField(default=0, editable=False)
+    latest_date = models.DateTimeField(null=True, blank=True, editable=False)
 
     def __str__(self):
         return f"{self.name}"
@@ -18,28 +33,93 @@ class Listing(models.Model):
     title = models.CharField(max_length=64)
     description = models.TextField(max_length=450)
     price = models.DecimalField(max_digits=5, decimal_places=2)
-    image = models.ImageField(upload_to='items')
+    image = models.ImageField(upload_to='items', storage=ContentAddressedStorage())
     date = models.DateTimeField()
+    # Top bid projection: actual_bid, bid_count and leading_bidder are set by
+    # the same UPDATE that accepts a bid (bidding.place_bid) and checked
+    # against the Bid rows by manage.py verify_bids
     actual_bid = models.DecimalField(max_digits=5, decimal_places=2, default=0)
+    bid_count = models.PositiveIntegerField(default=0)
+    leading_bidder = models.ForeignKey(User, on_delete=models.SET_NULL, null=True, blank=True, related_name="+")
     on_sell = models.BooleanField(default=True)
     owner = models.ForeignKey(User, on_delete=models.CASCADE, default=None, related_name="owner")
     category = models.ForeignKey(Category, on_delete=models.CASCADE, default=None, related_name="category")
+    # Bumped on every write that changes how the listing card looks, see
+    # templates/auctions/card.html
+    version = models.PositiveIntegerField(default=1)
+    # Widths of the resized copies stored next to the image, see thumbnails.py
+    thumbnails = models.CharField(max_length=64, blank=True, default="")
+    # Timed auctions are closed by manage.py close_auctions once this
+    # passes; None means the owner closes it with "sell"
+    ends_at = models.DateTimeField(null=True, blank=True)
+    winning_bid = models.ForeignKey('Bid', on_delete=models.SET_NULL, null=True, blank=True, related_name="+")
+    # Set on save and, for queryset.update(), by a trigger (triggers.py);
+    # the listing page's ETag is made from it
+    updated_at = models.DateTimeField(auto_now=True)
+    # Kept by triggers on auctions_comment (triggers.py)
+    comment_count = models.PositiveIntegerField(default=0, editable=False)
     
     
+    def _srcset(self, ext=None):
+        widths = [int(width) for width in self.thumbnails.split(",") if width]
+        return ", ".join(
+            f"{self.image.storage.url(variant_name(self.image.name, width, ext))} {width}w" for width in widths
+        )
+
+    @property
+    def srcset(self):
+        return self._srcset()
+
+    @property
+    def webp_srcset(self):
+        return self._srcset(".webp")
+
     def __str__(self):
         return f"{self.pk}| {self.title}, {self.owner}, {self.category}, {self.date}, on sell={self.on_sell}, {self.price} and bid {self.actual_bid}"
 
     class Meta:
         ordering = ['-date']
-    
+        indexes = [
+            # Feeds: "all" pages through every listing, "index" and the
+            # category search only through the ones still on sell, which
+            # the partial indexes keep small
+            models.Index(fields=['-date', '-id'], name='listing_date_idx'),
+            models.Index(fields=['-date', '-id'], name='listing_on_sell_date_idx', condition=models.Q(on_sell=True)),
+            models.Index(fields=['category', '-date', '-id'], name='listing_category_date_idx', condition=models.Q(on_sell=True)),
+            # Only open timed auctions, so a closing tick reads just the due ones
+            models.Index(fields=['ends_at'], name='listing_due_idx', condition=models.Q(on_sell=True, ends_at__isnull=False)),
+        ]
+
+
+class ListingChange(models.Model):
+    """The last change of each listing, for the API changes feed.
+
+    Written by triggers on auctions_listing (triggers.py) in the writing
+    transaction. SQLite has one writer at a time, so `seq` follows the
+    order the changes commit in, which updated_at (stamped before the
+    write lock is taken) does not. A deleted listing keeps its row, with
+    `deleted` set.
+    """
+    seq = models.AutoField(primary_key=True)
+    listing_id = models.IntegerField(unique=True)
+    deleted = models.BooleanField(default=False)
+    changed_at = models.DateTimeField()
+
+
 class Bid(models.Model):
     amount = models.DecimalField(max_digits=5, decimal_places=2)
+    date = models.DateTimeField(default=timezone.now)
     buyer = models.ForeignKey(User, on_delete=models.CASCADE, default=None, related_name="buyer")
     item = models.ForeignKey(Listing, on_delete=models.CASCADE, default=None, related_name="item_tobuy")
 
     def __str__(self):
         return f"{self.buyer}, {self.amount}, ({self.item}"
 
+    class Meta:
+        indexes = [
+            models.Index(fields=['item', '-amount', '-id'], name='bid_item_amount_idx'),
+        ]
+
 
 class Comment(models.Model):
     description = models.TextField(max_length=250)
@@ -52,8 +132,17 @@ class Comment(models.Model):
 
     class Meta:
         ordering = ['-date']
+        indexes = [
+            # A listing's comments newest first, paged by (date, id)
+            models.Index(fields=['item', '-date', '-id'], name='comment_item_page_idx'),
+        ]
 
 
 class Watchlist(models.Model):
     user = models.ForeignKey(User, on_delete=models.CASCADE, default=None, related_name="ownerList")
-    item = models.ForeignKey(Listing, on_delete=models.CASCADE, default=None, related_name="itemList")
\ No newline at end of file
+    item = models.ForeignKey(Listing, on_delete=models.CASCADE, default=None, related_name="itemList")
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['user', 'item'], name='watchlist_user_item_unique'),
+        ]
@@ -0,0 +1,163 @@
+"""Whole-page cache for anonymous visitors.
+
+The listing page and the feeds (index, all, a category's listings) render
+the same HTML for every anonymous visitor, so it is kept in the "pages"
+cache alias, which every worker on the machine shares. A page is stored
+under the generation tokens of its scopes (generations.py). Purging
+replaces a token instead of deleting the pages, so a render that started
+before the purge stores its page under a key nobody reads any more.
+Saves and deletes of listings purge through signals, closing a sale
+through close_listings, thumbnails once they are written, bulk loads by
+calling purge() themselves. New bids and comments purge only their
+listing's page: the cards show neither.
+
+When a page is missing, one request renders it while the others asking
+for it wait for its result (up to PAGE_CACHE_WAIT seconds), so a purge of
+a hot listing does not send every worker to the database at once. Pages
+are keyed on their path and the query parameters the view reads, so
+made-up parameters do not fill the cache.
+
+Logged-in users and requests with validators (answered by conditional.py)
+are never served from here. Pages that set cookies are not stored: the
+session and CSRF middleware set theirs after the view returns, so it is
+the request that tells (see cacheable).
+"""
+import contextlib
+import functools
+import hashlib
+import os
+import time
+from urllib.parse import urlencode
+
+from django.conf import settings
+from django.core.cache.backends.filebased import FileBasedCache
+from django.db.models.signals import post_delete, post_save
+
+from .categories import current_version
+from .conditional import PAGES_VERSION, has_validators
+from .generations import generations, page_cache, page_scopes, purge, purge_pages
+from .models import Bid, Comment, Listing, User
+from .throttling import file_lock
+
+# pylint: disable=no-member
+
+# How often a waiting request tries the render lock again, in seconds
+POLL = 0.02
+
+# Lock files a file cache's renders share out; a page waits only on the
+# pages of its own stripe
+LOCK_STRIPES = 64
+
+
+def anonymous_page(scope, query=("after",)):
+    """Cache the anonymous GET responses of the view, per path and value
+    of the `query` parameters it reads, under `scope`: a name from
+    generations.py, or a function of the view's arguments giving one
+    (listing_page, category_feed)."""
+    def decorator(view):
+        @functools.wraps(view)
+        def wrapper(request, *args, **kwargs):
+            if request.method not in ("GET", "HEAD") or request.user.is_authenticated or has_validators(request):
+                return view(request, *args, **kwargs)
+            tokens = generations(page_scopes(scope, *args, **kwargs))
+            # Other parameters do not change the page, so they must not
+            # make new entries either
+            url = request.path
+            params = urlencode([(name, request.GET[name]) for name in query if name in request.GET])
+            if params:
+                url = f"{url}?{params}"
+            key = ":".join(["page", str(PAGES_VERSION), current_version(), url] + tokens)
+            return single_flight(key, lambda: view(request, *args, **kwargs),
+                                 lambda response: cacheable(request, response))
+        return wrapper
+    return decorator
+
+
+def cacheable(request, response):
+    """Whether `response` is the same for every anonymous visitor."""
+    if response.status_code != 200 or response.streaming or response.cookies:
+        return False
+    # A page with a CSRF token, or one that wrote to the session, is about
+    # to get a cookie of its own from the middleware
+    session = getattr(request, "session", None)
+    return not request.META.get("CSRF_COOKIE_USED") and not (session is not None and session.modified)
+
+
+@contextlib.contextmanager
+def cache_lock(cache, key, timeout):
+    """A lock on `key` from the cache's own add(), atomic in memcached and
+    the local memory cache; TimeoutError after `timeout` seconds."""
+    deadline = time.monotonic() + timeout
+    while not cache.add(key, 1, timeout):
+        if time.monotonic() >= deadline:
+            raise TimeoutError(key)
+        time.sleep(POLL)
+    try:
+        yield
+    finally:
+        cache.delete(key)
+
+
+def render_lock(cache, key, timeout):
+    """The lock held while the page of `key` renders, shared by every worker.
+
+    The file cache's add() is a check then a write, which two workers can
+    both pass, so on it a flock() on one of LOCK_STRIPES files in the
+    cache directory is taken instead.
+    """
+    if isinstance(cache, FileBasedCache):
+        stripe = int(hashlib.md5(key.encode()).hexdigest(), 16) % LOCK_STRIPES
+        return file_lock(os.path.join(cache._dir, "rendering", f"{stripe}.lock"), timeout)
+    return cache_lock(cache, f"{key}:rendering", timeout)
+
+
+def single_flight(key, render, storable=lambda response: True):
+    cache = page_cache()
+    response = cache.get(key)
+    if response is not None:
+        return response
+    try:
+        with render_lock(cache, key, getattr(settings, "PAGE_CACHE_WAIT", 2)):
+            # Whoever held the lock before may have stored the page
+            response = cache.get(key)
+            if response is None:
+                response = render()
+                if storable(response):
+                    cache.set(key, response, getattr(settings, "PAGE_CACHE_SECONDS", 300))
+            return response
+    except TimeoutError:
+        # The renderer is too slow or gone; render without storing
+        return render()
+
+
+def listing_saved(sender, instance, created, **kwargs):
+    if created:
+        purge([instance.pk], [instance.category_id])
+    else:
+        # An edit may have moved it out of another category's feed
+        purge([instance.pk])
+
+
+def listing_deleted(sender, instance, **kwargs):
+    purge([instance.pk], [instance.category_id])
+
+
+def user_saved(sender, instance, created, update_fields=None, **kwargs):
+    # Cards and pages show the owner's name; logins only touch last_login
+    if not created and (update_fields is None or "username" in update_fields):
+        purge()
+
+
+def item_changed(sender, instance, **kwargs):
+    # A comment or a bid: only its listing's page, the cards show neither
+    purge_pages([instance.item_id])
+
+
+def connect_signals():
+    post_save.connect(listing_saved, sender=Listing, dispatch_uid="auctions.pagecache.listing_save")
+    post_delete.connect(listing_deleted, sender=Listing, dispatch_uid="auctions.pagecache.listing_delete")
+    post_save.connect(user_saved, sender=User, dispatch_uid="auctions.pagecache.user_save")
+    # Not post_delete: a receiver there would stop Django from deleting a
+    # listing's bids and comments in one statement
+    post_save.connect(item_changed, sender=Comment, dispatch_uid="auctions.pagecache.comment_save")
+    post_save.connect(item_changed, sender=Bid, dispatch_uid="auctions.pagecache.bid_save")
@@ -0,0 +1,48 @@
+import base64
+import datetime
+
+from django.conf import settings
+from django.db.models import Q
+
+
+def encode_cursor(value, pk):
+    """A cursor token for the row at (value, pk); dates are written as ISO 8601."""
+    value = value.isoformat() if hasattr(value, "isoformat") else str(value)
+    raw = f"{value}|{pk}".encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip("=")
+
+
+def decode_cursor(token, parse=datetime.datetime.fromisoformat):
+    """Turn a cursor token back into (value, pk), the value read by `parse`;
+    None if it is missing or invalid."""
+    if not token:
+        return None
+    try:
+        raw = base64.urlsafe_b64decode(token + "=" * (-len(token) % 4)).decode()
+        value, pk = raw.split("|")
+        return parse(value), int(pk)
+    except (ValueError, ArithmeticError, UnicodeDecodeError):
+        # ArithmeticError: what Decimal raises on a bad number
+        return None
+
+
+def keyset_page(queryset, cursor=None, size=None, field="date", parse=datetime.datetime.fromisoformat):
+    """Return one page of `queryset` ordered by (-field, -id) and the next cursor.
+
+    Rows are selected with a `WHERE (field, id) < cursor` condition instead
+    of an OFFSET, so every page costs the same no matter how deep it is.
+    `parse` reads the field back from a cursor.
+    """
+    if size is None:
+        size = getattr(settings, "LISTINGS_PAGE_SIZE", 24)
+    queryset = queryset.order_by(f"-{field}", "-id")
+    position = decode_cursor(cursor, parse)
+    if position is not None:
+        value, pk = position
+        queryset = queryset.filter(Q(**{f"{field}__lt": value}) | Q(**{field: value, "id__lt": pk}))
+    items = list(queryset[:size + 1])
+    next_cursor = None
+    if len(items) > size:
+        items = items[:size]
+        next_cursor = encode_cursor(getattr(items[-1], field), items[-1].id)
+    return items, next_cursor
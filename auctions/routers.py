@@ -0,0 +1,46 @@
+import contextvars
+import functools
+
+from django.db import DEFAULT_DB_ALIAS, connections
+
+# Set while a view decorated with @read_only runs
+reading = contextvars.ContextVar("reading", default=False)
+
+READ_ALIAS = "read"
+
+
+def read_only(view):
+    """Send the queries of a view that never writes to the read connection."""
+    @functools.wraps(view)
+    def wrapper(*args, **kwargs):
+        token = reading.set(True)
+        try:
+            return view(*args, **kwargs)
+        finally:
+            reading.reset(token)
+    return wrapper
+
+
+class ReadRouter:
+    """Reads of @read_only views go to the "read" alias, everything else to default.
+
+    Both aliases open the same SQLite file; the read one has query_only set
+    and no BEGIN IMMEDIATE, so it never queues behind writers. Inside an
+    atomic block on default reads stay there, to see its own writes.
+    """
+
+    def db_for_read(self, model, **hints):
+        if reading.get() and READ_ALIAS in connections.databases \
+                and not connections[DEFAULT_DB_ALIAS].in_atomic_block:
+            return READ_ALIAS
+        return None
+
+    def db_for_write(self, model, **hints):
+        return DEFAULT_DB_ALIAS
+
+    def allow_relation(self, obj1, obj2, **hints):
+        # Same database file behind both aliases
+        return True
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        return db == DEFAULT_DB_ALIAS
@@ -0,0 +1,74 @@
+import re
+
+from django.conf import settings
+from django.db import connections, router
+
+from .models import Listing
+from .pagination import decode_cursor, encode_cursor
+
+# pylint: disable=no-member
+
+# Column weights for bm25(): a word in the title counts ten times one in the description
+TITLE_WEIGHT = 10.0
+DESCRIPTION_WEIGHT = 1.0
+
+
+def match_expression(query):
+    """Turn what the user typed into an FTS5 query.
+
+    Every word must appear (AND), as a prefix so "guit" finds "guitar".
+    Words are quoted, so FTS5 operators and punctuation in the input are
+    taken literally. Returns None when there is nothing to search for.
+    """
+    words = re.findall(r"\w+", query)
+    if not words:
+        return None
+    return " ".join(f'"{word}"*' for word in words)
+
+
+def search_listings(query, category=None, on_sell=None, cursor=None, size=None):
+    """Return one page of listings matching `query`, best match first, and the next cursor.
+
+    Ranked by bm25 over the auctions_listing_fts index and paginated by
+    (score, id) keyset, like the feeds are by (date, id).
+    """
+    if size is None:
+        size = getattr(settings, "LISTINGS_PAGE_SIZE", 24)
+    expression = match_expression(query)
+    if expression is None:
+        return [], None
+
+    score = f"bm25(auctions_listing_fts, {TITLE_WEIGHT}, {DESCRIPTION_WEIGHT})"
+    where = ["auctions_listing_fts MATCH %s"]
+    params = [expression]
+    if category is not None:
+        where.append("listing.category_id = %s")
+        params.append(category)
+    if on_sell is not None:
+        where.append("listing.on_sell = %s")
+        params.append(on_sell)
+    position = decode_cursor(cursor, float)
+    if position is not None:
+        where.append(f"({score} > %s OR ({score} = %s AND listing.id > %s))")
+        params.extend([position[0], position[0], position[1]])
+    params.append(size + 1)
+
+    # Where the ORM would send a read of listings: the read connection
+    # inside @read_only views
+    with connections[router.db_for_read(Listing)].cursor() as db:
+        db.execute(
+            f"SELECT listing.id, {score} AS score "
+            "FROM auctions_listing_fts "
+            "JOIN auctions_listing AS listing ON listing.id = auctions_listing_fts.rowid "
+            f"WHERE {' AND '.join(where)} "
+            "ORDER BY score, listing.id LIMIT %s",
+            params,
+        )
+        rows = db.fetchall()
+
+    next_cursor = None
+    if len(rows) > size:
+        rows = rows[:size]
+        next_cursor = encode_cursor(rows[-1][1], rows[-1][0])
+    listings = Listing.objects.select_related("owner", "category").in_bulk([pk for pk, _ in rows])
+    return [listings[pk] for pk, _ in rows if pk in listings], next_cursor
@@ -0,0 +1,266 @@
+import gzip
+import hashlib
+import mimetypes
+import os
+import posixpath
+import re
+import shutil
+import uuid
+
+from django.contrib.staticfiles.storage import ManifestStaticFilesStorage, StaticFilesStorage
+from django.core.exceptions import SuspiciousFileOperation
+from django.core.files.storage import FileSystemStorage
+from django.http import FileResponse, Http404, HttpResponse, StreamingHttpResponse
+from django.utils._os import safe_join
+from django.utils.cache import get_conditional_response
+from django.utils.deconstruct import deconstructible
+from django.utils.http import http_date
+from PIL import Image
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+# A year, the longest max-age caches are asked to honour
+IMMUTABLE_MAX_AGE = 60 * 60 * 24 * 365
+
+# <64 hex digits>[_w<width>].<ext>, the names ContentAddressedStorage hands out
+CONTENT_ADDRESSED_NAME = re.compile(r"(^|/)[0-9a-f]{64}(_w\d+)?\.\w+$")
+
+# <name>.<12 hex digits>.<ext>, the names ManifestStaticFilesStorage hands out
+STATIC_HASHED_NAME = re.compile(r"\.[0-9a-f]{12}\.\w+$")
+
+# Collected files worth compressing; images and fonts already are
+COMPRESSIBLE = (".css", ".js", ".json", ".map", ".svg", ".txt", ".xml", ".html")
+
+# Precompressed copies kept next to a file, best first: (Accept-Encoding token, suffix)
+ENCODINGS = (("br", ".br"), ("gzip", ".gz"))
+
+RANGE = re.compile(r"^bytes=(\d*)-(\d*)$")
+
+BLOCK_SIZE = 1 << 16
+
+
+def content_hash(content):
+    """SHA-256 of a django File, leaving it rewound for the actual save."""
+    digest = hashlib.sha256()
+    for chunk in content.chunks():
+        digest.update(chunk)
+    content.seek(0)
+    return digest.hexdigest()
+
+
+def content_name(name, digest):
+    """items/photo.JPG + digest -> items/<digest>.jpg"""
+    directory, filename = os.path.split(name)
+    return os.path.join(directory, digest + os.path.splitext(filename)[1].lower())
+
+
+@deconstructible
+class ContentAddressedStorage(FileSystemStorage):
+    """File storage that names every file after the SHA-256 of its bytes.
+
+    Uploading bytes that are already stored returns the existing name, so
+    identical images are kept once and a name never changes content, which
+    lets them be served as immutable.
+    """
+
+    def _save(self, name, content):
+        name = content_name(name, content_hash(content))
+        if self.exists(name):
+            return name
+        # Write under a private name first and rename, so a concurrent
+        # upload of the same bytes can never see a half written file
+        temporary = super()._save(os.path.join(os.path.dirname(name), f".{uuid.uuid4().hex}.tmp"), content)
+        os.replace(self.path(temporary), self.path(name))
+        return name
+
+
+def ingest_file(source, root, directory):
+    """Copy the file at `source` into `root`/`directory` under its content name.
+
+    What ContentAddressedStorage does on save, but with plain paths so it
+    can run in a worker process. Returns the storage name.
+    """
+    digest = hashlib.sha256()
+    with open(source, "rb") as original:
+        for chunk in iter(lambda: original.read(1 << 16), b""):
+            digest.update(chunk)
+    name = content_name(os.path.join(directory, os.path.basename(source)), digest.hexdigest())
+    path = os.path.join(root, name)
+    if not os.path.exists(path):
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        temporary = os.path.join(os.path.dirname(path), f".{uuid.uuid4().hex}.tmp")
+        shutil.copyfile(source, temporary)
+        os.replace(temporary, path)
+    return name
+
+
+def ingest_image(source, root, directory):
+    """Check that `source` is an image and ingest_file() it; (name, error) for the row.
+
+    Run in import_listings' worker processes, which under the spawn and
+    forkserver start methods import this module before Django is set up:
+    nothing here may need the models.
+    """
+    try:
+        with Image.open(source) as image:
+            image.verify()
+        return ingest_file(source, root, directory), None
+    except (OSError, SyntaxError, ValueError, Image.DecompressionBombError) as reason:
+        # What PIL raises on unreadable, malformed and oversized images
+        return None, f"bad image {source}: {reason}"
+
+
+def write_compressed(path):
+    """Write <path>.gz, and <path>.br when brotli is installed, if they come out smaller."""
+    with open(path, "rb") as original:
+        content = original.read()
+    variants = [(".gz", gzip.compress(content, 9, mtime=0))]
+    if brotli is not None:
+        variants.append((".br", brotli.compress(content, quality=11)))
+    for suffix, compressed in variants:
+        if len(compressed) < len(content):
+            temporary = f"{path}.{uuid.uuid4().hex}.tmp"
+            with open(temporary, "wb") as output:
+                output.write(compressed)
+            os.replace(temporary, path + suffix)
+        elif os.path.exists(path + suffix):
+            # Left by an earlier collectstatic of other content
+            os.remove(path + suffix)
+
+
+class CompressedManifestStaticFilesStorage(ManifestStaticFilesStorage):
+    """Hashed static names, each also written gzipped (and brotli compressed).
+
+    collectstatic does the compressing once, so serve_file only picks the
+    copy the client accepts. Before collectstatic has run, in development
+    and the tests, there is no manifest and the names stay unhashed.
+    """
+
+    def post_process(self, paths, dry_run=False, **options):
+        yield from super().post_process(paths, dry_run, **options)
+        if dry_run:
+            return
+        for name in set(paths) | set(self.hashed_files.values()):
+            if name.endswith(COMPRESSIBLE) and self.exists(name):
+                write_compressed(self.path(name))
+
+    def url(self, name, force=False):
+        if not self.hashed_files:
+            return StaticFilesStorage.url(self, name)
+        return super().url(name, force)
+
+
+def accepted_encodings(request):
+    """The content codings in Accept-Encoding, less those given q=0."""
+    accepted = set()
+    for token in request.META.get("HTTP_ACCEPT_ENCODING", "").split(","):
+        coding, _, quality = token.replace(" ", "").partition(";q=")
+        try:
+            if quality and float(quality) == 0:
+                continue
+        except ValueError:
+            continue
+        accepted.add(coding.lower())
+    return accepted
+
+
+def byte_range(request, size, etag, last_modified):
+    """(first, last) byte asked for by a single Range header, None for the whole
+    file, or False when the range lies outside it."""
+    match = RANGE.match(request.META.get("HTTP_RANGE", "").strip())
+    if not match or not any(match.groups()):
+        return None
+    if_range = request.META.get("HTTP_IF_RANGE")
+    if if_range and if_range not in (etag, last_modified):
+        # The client holds another version: send all of this one
+        return None
+    first, last = match.groups()
+    if not first:
+        # The last `last` bytes
+        if int(last) == 0:
+            return False
+        return max(size - int(last), 0), size - 1
+    first = int(first)
+    if last and int(last) < first:
+        # Malformed, so ignored
+        return None
+    if first >= size:
+        return False
+    return first, min(int(last), size - 1) if last else size - 1
+
+
+def read_range(path, first, last):
+    with open(path, "rb") as content:
+        content.seek(first)
+        remaining = last - first + 1
+        while remaining:
+            block = content.read(min(BLOCK_SIZE, remaining))
+            if not block:
+                break
+            remaining -= len(block)
+            yield block
+
+
+def serve_file(request, path, document_root=None, immutable=CONTENT_ADDRESSED_NAME):
+    """Serve a collected static file or an upload, fit to face clients directly.
+
+    Names matching `immutable` (a hashed name) are cached for a year,
+    others must be revalidated, which the ETag and Last-Modified answer.
+    A gzip or brotli copy written by CompressedManifestStaticFilesStorage
+    is sent instead when the client accepts it. A single byte range is
+    honoured. Whole files go out as a FileResponse, which the WSGI server's
+    file_wrapper can send with sendfile().
+    """
+    path = posixpath.normpath(path).lstrip("/")
+    if any(part.startswith(".") for part in path.split("/")):
+        # Uploads being written, and anything else hidden
+        raise Http404
+    try:
+        fullpath = safe_join(document_root, path)
+    except SuspiciousFileOperation:
+        raise Http404
+    if not os.path.isfile(fullpath):
+        raise Http404
+
+    content_type, encoding = mimetypes.guess_type(fullpath)
+    if encoding or not content_type:
+        content_type = "application/octet-stream"
+    variants = [(coding, suffix) for coding, suffix in ENCODINGS if os.path.isfile(fullpath + suffix)]
+    accepted = accepted_encodings(request)
+    coding, suffix = next(((coding, suffix) for coding, suffix in variants if coding in accepted), (None, ""))
+    fullpath += suffix
+    stat = os.stat(fullpath)
+
+    etag = f'"{stat.st_mtime_ns:x}-{stat.st_size:x}{suffix}"'
+    last_modified = http_date(stat.st_mtime)
+    headers = {"ETag": etag, "Last-Modified": last_modified, "Accept-Ranges": "bytes"}
+    if immutable is not None and immutable.search(path):
+        headers["Cache-Control"] = f"public, max-age={IMMUTABLE_MAX_AGE}, immutable"
+    else:
+        headers["Cache-Control"] = "public, no-cache"
+    if variants:
+        headers["Vary"] = "Accept-Encoding"
+
+    response = get_conditional_response(request, etag=etag, last_modified=int(stat.st_mtime))
+    if response is None:
+        span = byte_range(request, stat.st_size, etag, last_modified)
+        if span is False:
+            response = HttpResponse(status=416, content_type=content_type)
+            response["Content-Range"] = f"bytes */{stat.st_size}"
+        elif span is not None:
+            first, last = span
+            response = StreamingHttpResponse(read_range(fullpath, first, last), status=206,
+                                             content_type=content_type)
+            response["Content-Range"] = f"bytes {first}-{last}/{stat.st_size}"
+            response["Content-Length"] = last - first + 1
+        else:
+            response = FileResponse(open(fullpath, "rb"), content_type=content_type)
+            del response["Content-Disposition"]
+        if coding and response.status_code != 416:
+            response["Content-Encoding"] = coding
+    for header, value in headers.items():
+        response[header] = value
+    return response
@@ -0,0 +1,159 @@
+"""Synthetic auctions data for load tests and benchmarks.
+
+Users, categories, listings sharing a pool of generated images, and bids,
+comments and watchlist entries spread over the listings with a Zipf law,
+so a few listings get most of the activity like on a real site. Every
+table is written with bulk_create; the same seed gives the same data.
+"""
+import datetime
+import io
+import random
+from decimal import Decimal
+
+from django.contrib.auth.hashers import make_password
+from django.core.files.base import ContentFile
+from django.db import transaction
+from django.db.models import OuterRef, Subquery
+from django.utils import timezone
+from PIL import Image
+
+from .models import Bid, Category, Comment, Listing, User, Watchlist
+from .generations import purge
+
+# pylint: disable=no-member
+
+SCALES = {
+    "tiny": {"users": 20, "categories": 4, "listings": 50, "bids": 200, "comments": 100, "watchlists": 50, "images": 4},
+    "small": {"users": 500, "categories": 12, "listings": 5000, "bids": 25000, "comments": 10000, "watchlists": 5000, "images": 20},
+    "large": {"users": 20000, "categories": 30, "listings": 200000, "bids": 1000000, "comments": 400000, "watchlists": 200000, "images": 100},
+}
+
+# Everyone generated logs in with this
+PASSWORD = "synthetic"
+
+WORDS = (
+    "vintage guitar lamp chair bike camera watch vinyl record poster desk sofa jacket boots "
+    "novel comic console keyboard drone tent kettle mirror rug vase clock radio speaker "
+    "old new rare signed mint boxed restored handmade antique retro classic original"
+).split()
+
+BATCH = 2000
+
+
+def zipf_weights(count, exponent):
+    return [1 / (rank ** exponent) for rank in range(1, count + 1)]
+
+
+def sentence(rng, words):
+    return " ".join(rng.choice(WORDS) for _ in range(words)).capitalize()
+
+
+def make_images(rng, count):
+    """Store `count` distinct small JPEGs and return their names."""
+    storage = Listing._meta.get_field("image").storage
+    names = []
+    for n in range(count):
+        buffer = io.BytesIO()
+        color = (rng.randrange(256), rng.randrange(256), rng.randrange(256))
+        Image.new("RGB", (800, 600), color).save(buffer, "JPEG", quality=70)
+        names.append(storage.save(f"items/synthetic-{n}.jpg", ContentFile(buffer.getvalue())))
+    return names
+
+
+def generate(users, categories, listings, bids, comments, watchlists, images, seed=1, exponent=1.1, prefix="synthetic", log=None):
+    """Create the rows and return how many of each were written."""
+    rng = random.Random(seed)
+    now = timezone.now()
+    log = log or (lambda message: None)
+    password = make_password(PASSWORD)
+
+    if User.objects.filter(username__startswith=prefix).exists():
+        raise ValueError(f"Users named {prefix}* exist already, pick another prefix")
+
+    with transaction.atomic():
+        User.objects.bulk_create(
+            [User(username=f"{prefix}{n}", email=f"{prefix}{n}@example.com", password=password) for n in range(users)],
+            batch_size=BATCH,
+        )
+        user_ids = list(User.objects.filter(username__startswith=prefix).values_list("id", flat=True))
+        Category.objects.bulk_create([Category(name=f"{sentence(rng, 1)} {n}") for n in range(categories)])
+        category_ids = list(Category.objects.order_by("-id").values_list("id", flat=True)[:categories])
+    log(f"{users} users, {categories} categories")
+
+    image_names = make_images(rng, images)
+    first = Listing.objects.order_by("-id").values_list("id", flat=True).first() or 0
+    for start in range(0, listings, BATCH):
+        with transaction.atomic():
+            Listing.objects.bulk_create([
+                Listing(
+                    title=sentence(rng, rng.randint(2, 5))[:64],
+                    description=sentence(rng, rng.randint(10, 40))[:450],
+                    price=Decimal(rng.randint(500, 30000)) / 100,
+                    image=rng.choice(image_names),
+                    date=now - datetime.timedelta(seconds=rng.randint(0, 90 * 24 * 3600)),
+                    owner_id=rng.choice(user_ids),
+                    category_id=rng.choice(category_ids),
+                    on_sell=rng.random() > 0.2,
+                )
+                for _ in range(start, min(start + BATCH, listings))
+            ], batch_size=BATCH)
+        log(f"{min(start + BATCH, listings)} listings")
+    items = list(Listing.objects.filter(id__gt=first).values_list("id", "owner_id", "price", "date"))
+    # Popular listings are spread over the id range rather than the oldest ones
+    rng.shuffle(items)
+    weights = zipf_weights(len(items), exponent)
+
+    # Bids go up by a few euros per listing, the projection is written at the end
+    top = {}
+    rows = []
+    for item_id, owner_id, price, date in rng.choices(items, weights, k=bids):
+        amount, count, _ = top.get(item_id, (price, 0, None))
+        amount += Decimal(rng.randint(50, 500)) / 100
+        if amount >= Decimal("1000"):
+            continue
+        buyer = rng.choice(user_ids)
+        if buyer == owner_id:
+            continue
+        top[item_id] = (amount, count + 1, buyer)
+        rows.append(Bid(item_id=item_id, buyer_id=buyer, amount=amount,
+                        date=min(now, date + datetime.timedelta(minutes=count + 1))))
+    for start in range(0, len(rows), BATCH):
+        with transaction.atomic():
+            Bid.objects.bulk_create(rows[start:start + BATCH], batch_size=BATCH)
+    with transaction.atomic():
+        listings_with_bids = Listing.objects.in_bulk(list(top))
+        for item_id, (amount, count, buyer) in top.items():
+            listing = listings_with_bids[item_id]
+            listing.actual_bid, listing.bid_count, listing.leading_bidder_id = amount, count, buyer
+        Listing.objects.bulk_update(listings_with_bids.values(), ["actual_bid", "bid_count", "leading_bidder"], batch_size=BATCH)
+        Listing.objects.filter(id__gt=first, on_sell=False, bid_count__gt=0).update(winning_bid=Subquery(
+            Bid.objects.filter(item=OuterRef("pk")).order_by("-amount", "-id").values("id")[:1]
+        ))
+    log(f"{len(rows)} bids")
+
+    rows = [
+        Comment(item_id=item_id, user_id=rng.choice(user_ids), description=sentence(rng, rng.randint(3, 30))[:250],
+                date=min(now, date + datetime.timedelta(minutes=rng.randint(1, 10000))))
+        for item_id, _, _, date in rng.choices(items, weights, k=comments)
+    ]
+    for start in range(0, len(rows), BATCH):
+        with transaction.atomic():
+            Comment.objects.bulk_create(rows[start:start + BATCH], batch_size=BATCH)
+    log(f"{len(rows)} comments")
+
+    pairs = {(rng.choice(user_ids), item_id) for item_id, *_ in rng.choices(items, weights, k=watchlists)}
+    with transaction.atomic():
+        Watchlist.objects.bulk_create([Watchlist(user_id=user, item_id=item) for user, item in pairs], batch_size=BATCH)
+    log(f"{len(pairs)} watchlist entries")
+    # Written without signals
+    purge()
+
+    return {
+        "users": users,
+        "categories": categories,
+        "listings": listings,
+        "bids": sum(count for _, count, _ in top.values()),
+        "comments": comments,
+        "watchlists": len(pairs),
+        "images": images,
+    }
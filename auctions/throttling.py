@@ -0,0 +1,243 @@
+"""Admission control for the write endpoints.
+
+Every route listed in THROTTLE_RATES gets a token bucket per client (the
+user, or the IP for anonymous requests): a request takes a token, tokens
+come back at `rate` per second up to `burst`, and a client with none left
+gets a 429. On top of that at most THROTTLE_MAX_WRITES of those requests
+run at once in a process; the next ones get a 503 instead of queueing on
+the SQLite write lock. Both answers come before the view, so before the
+database.
+
+The buckets live in the process by default. With THROTTLE_BACKEND =
+"cache" they are counted in the THROTTLE_CACHE alias instead, which every
+worker shares.
+"""
+import asyncio
+import contextlib
+import fcntl
+import math
+import os
+import threading
+import time
+from collections import Counter
+
+from django.conf import settings
+from django.contrib.admin.views.decorators import staff_member_required
+from django.core.cache import caches
+from django.core.cache.backends.base import BaseCache
+from django.core.cache.backends.filebased import FileBasedCache
+from django.core.exceptions import ImproperlyConfigured
+from django.http import HttpResponse, JsonResponse
+
+# Buckets kept per process before the idle (full) ones are dropped
+MAX_BUCKETS = 10000
+
+_counters = Counter()
+_counters_lock = threading.Lock()
+
+
+def count(route, outcome):
+    with _counters_lock:
+        _counters[(route, outcome)] += 1
+
+
+def counters():
+    """{(route, "admitted" | "limited" | "shed"): requests} since start."""
+    with _counters_lock:
+        return dict(_counters)
+
+
+class MemoryBuckets:
+    """Token buckets in a dict, exact but per process."""
+
+    def __init__(self):
+        self.buckets = {}
+        self.lock = threading.Lock()
+
+    def take(self, key, rate, burst):
+        """Take a token; 0 if there was one, else the seconds until there is."""
+        now = time.monotonic()
+        with self.lock:
+            tokens, updated = self.buckets.get(key, (burst, now))
+            tokens = min(burst, tokens + (now - updated) * rate)
+            if tokens < 1:
+                self.buckets[key] = (tokens, now)
+                return (1 - tokens) / rate
+            if len(self.buckets) >= MAX_BUCKETS and key not in self.buckets:
+                self.prune(now)
+            self.buckets[key] = (tokens - 1, now)
+            return 0
+
+    def prune(self, now):
+        # A bucket that has refilled is the same as no bucket
+        for key, (tokens, updated) in list(self.buckets.items()):
+            budget = budgets().get(key[0])
+            if budget is None or tokens + (now - updated) * budget[1] >= budget[2]:
+                del self.buckets[key]
+
+
+# How often a lock with a timeout is tried again, in seconds
+LOCK_POLL = 0.02
+
+
+@contextlib.contextmanager
+def file_lock(path, timeout=None):
+    """Hold an exclusive flock() on `path`, across threads and processes.
+
+    With `timeout`, raise TimeoutError when it is still held by someone
+    else after that many seconds.
+    """
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path, "a") as lock:
+        if timeout is None:
+            fcntl.flock(lock, fcntl.LOCK_EX)
+        else:
+            deadline = time.monotonic() + timeout
+            while True:
+                try:
+                    fcntl.flock(lock, fcntl.LOCK_EX | fcntl.LOCK_NB)
+                    break
+                except BlockingIOError:
+                    if time.monotonic() >= deadline:
+                        raise TimeoutError(path) from None
+                    time.sleep(LOCK_POLL)
+        try:
+            yield
+        finally:
+            fcntl.flock(lock, fcntl.LOCK_UN)
+
+
+def counter_lock(cache):
+    """What makes add() then incr() on `cache` one step.
+
+    Memcached and the local memory cache count atomically themselves.
+    The file cache's incr() is a read then a write, so concurrent requests
+    would lose counts; its workers share a directory, and a lock file in it.
+    """
+    if type(cache).incr is not BaseCache.incr:
+        return contextlib.nullcontext
+    if isinstance(cache, FileBasedCache):
+        path = os.path.join(cache._dir, "throttle.lock")
+        return lambda: file_lock(path)
+    raise ImproperlyConfigured(
+        "THROTTLE_CACHE must be a memcached, local memory or file based cache: "
+        f"{type(cache).__name__} does not count atomically")
+
+
+class CacheBuckets:
+    """A fixed window of `burst` requests per `burst / rate` seconds in a shared cache.
+
+    Coarser than a token bucket (a client can get up to twice the burst
+    across a window edge), but it only needs add() and incr(), made atomic
+    by counter_lock where the backend's are not.
+    """
+
+    def __init__(self):
+        self.cache = caches[getattr(settings, "THROTTLE_CACHE", "default")]
+        self.lock = counter_lock(self.cache)
+
+    def take(self, key, rate, burst):
+        window = burst / rate
+        now = time.time()
+        slot = int(now // window)
+        cache_key = f"throttle:{key[0]}:{key[1]}:{slot}"
+        with self.lock():
+            self.cache.add(cache_key, 0, math.ceil(window) + 1)
+            try:
+                used = self.cache.incr(cache_key)
+            except ValueError:
+                # Expired between add() and incr()
+                self.cache.set(cache_key, 1, math.ceil(window) + 1)
+                used = 1
+        if used > burst:
+            return (slot + 1) * window - now
+        return 0
+
+
+def budgets():
+    return getattr(settings, "THROTTLE_RATES", {})
+
+
+def client(request):
+    if request.user.is_authenticated:
+        return f"user:{request.user.pk}"
+    return f"ip:{request.META.get('REMOTE_ADDR', '')}"
+
+
+class ThrottleMiddleware:
+    """Token buckets per client and route plus a cap on concurrent writes.
+
+    Goes after AuthenticationMiddleware, which it needs to tell users apart.
+    """
+
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if asyncio.iscoroutinefunction(get_response):
+            # How Django's MiddlewareMixin marks itself async
+            self._is_coroutine = asyncio.coroutines._is_coroutine
+        if getattr(settings, "THROTTLE_BACKEND", "memory") == "cache":
+            self.buckets = CacheBuckets()
+        else:
+            self.buckets = MemoryBuckets()
+        self.running = 0
+        self.lock = threading.Lock()
+
+    def __call__(self, request):
+        if asyncio.iscoroutinefunction(self.get_response):
+            return self.__acall__(request)
+        try:
+            return self.get_response(request)
+        finally:
+            self.release(request)
+
+    async def __acall__(self, request):
+        try:
+            return await self.get_response(request)
+        finally:
+            self.release(request)
+
+    def release(self, request):
+        if getattr(request, "_throttle_slot", False):
+            with self.lock:
+                self.running -= 1
+
+    def process_view(self, request, view_func, view_args, view_kwargs):
+        route = request.resolver_match.url_name
+        budget = budgets().get(route)
+        if budget is None or request.method not in budget[0]:
+            return None
+        _, rate, burst = budget
+
+        wait = self.buckets.take((route, client(request)), rate, burst)
+        if wait:
+            count(route, "limited")
+            response = HttpResponse("Too many requests, slow down.", status=429, content_type="text/plain")
+            response["Retry-After"] = str(math.ceil(wait))
+            return response
+
+        with self.lock:
+            if self.running >= getattr(settings, "THROTTLE_MAX_WRITES", 16):
+                shed = True
+            else:
+                shed = False
+                self.running += 1
+        if shed:
+            count(route, "shed")
+            response = HttpResponse("Busy, try again in a moment.", status=503, content_type="text/plain")
+            response["Retry-After"] = "1"
+            return response
+
+        request._throttle_slot = True
+        count(route, "admitted")
+        return None
+
+
+@staff_member_required
+def stats(request):
+    routes = {}
+    for (route, outcome), total in counters().items():
+        routes.setdefault(route, {})[outcome] = total
+    return JsonResponse({"routes": routes})
@@ -0,0 +1,81 @@
+import os
+from concurrent.futures import ProcessPoolExecutor
+
+from django.conf import settings
+from django.db import connection
+from django.db.models import F
+from PIL import Image, ImageOps
+
+from .generations import purge_listings
+
+_pool = None
+
+
+def widths():
+    return getattr(settings, "THUMBNAIL_WIDTHS", (320, 640, 1024))
+
+
+def variant_name(name, width, ext=None):
+    """items/photo.jpg -> items/photo_w320.jpg (or .webp)."""
+    base, original_ext = os.path.splitext(name)
+    return f"{base}_w{width}{ext or original_ext}"
+
+
+def render_variants(path, sizes, quality=80):
+    """Write the resized copies of the image at `path` next to it.
+
+    Runs in a worker process, so it only deals with file paths. Widths that
+    would upscale the original are skipped. Returns the widths written.
+    """
+    made = []
+    with Image.open(path) as original:
+        image_format = original.format
+        image = ImageOps.exif_transpose(original)
+        if image_format == "JPEG" and image.mode not in ("RGB", "L"):
+            image = image.convert("RGB")
+        for width in sorted(sizes):
+            if width >= image.width:
+                continue
+            height = max(1, round(image.height * width / image.width))
+            thumbnail = image.resize((width, height), Image.LANCZOS)
+            thumbnail.save(variant_name(path, width), image_format, quality=quality)
+            thumbnail.save(variant_name(path, width, ".webp"), "WEBP", quality=quality)
+            made.append(width)
+    return made
+
+
+def pool():
+    global _pool
+    if _pool is None:
+        _pool = ProcessPoolExecutor(max_workers=settings.THUMBNAIL_WORKERS)
+    return _pool
+
+
+def store_thumbnails(listings, made):
+    # Record the widths and bump the version so cached cards pick up srcset
+    listings.update(
+        thumbnails=",".join(str(width) for width in made),
+        version=F("version") + 1,
+    )
+    purge_listings(listings)
+
+
+def schedule_thumbnails(listing):
+    """Generate the thumbnails of a freshly uploaded listing image.
+
+    With THUMBNAIL_WORKERS = 0 the work is done inline, otherwise it is
+    handed to the process pool and the listing row is updated when done.
+    """
+    path = listing.image.path
+    listings = type(listing).objects.filter(pk=listing.pk)
+    if not getattr(settings, "THUMBNAIL_WORKERS", 0):
+        store_thumbnails(listings, render_variants(path, widths()))
+        return
+
+    def done(future):
+        try:
+            store_thumbnails(listings, future.result())
+        finally:
+            connection.close()
+
+    pool().submit(render_variants, path, widths()).add_done_callback(done)
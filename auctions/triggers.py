@@ -0,0 +1,166 @@
+"""SQLite triggers on auctions_listing, as the migrations leave them.
+
+- The full-text search index auctions_listing_fts (see search.py) follows
+  inserts, deletes and title/description edits.
+- Category.active_count, total_count and latest_date follow inserts,
+  deletes, sales, recategorizations and date changes in the same
+  transaction. Triggers rather than signals, so that queryset.update() and
+  bulk_create are covered too.
+- Listing.updated_at is stamped on every update that does not set it
+  itself, which is what the listing page's ETag is made from.
+- Listing.comment_count follows inserts and deletes on auctions_comment.
+- auctions_listingchange gets a new sequence number for a listing on each
+  insert, update and delete, which is what the API changes feed pages
+  through.
+
+The migrations that install them carry their own frozen copy of the SQL,
+so editing this module does not change what an old migration does. SQLite
+drops a table's triggers with it, and Django's SQLite schema editor
+rebuilds auctions_listing for most field changes: a migration that alters
+Listing must reinstall every trigger on it afterwards, and first (run last
+when unapplying) put back the ones of the migration before. This module
+is what rebuild_search_index and the tests read.
+"""
+
+FTS_INDEX = "auctions_listing_fts"
+
+
+def fts_table(index):
+    return f"""
+    CREATE VIRTUAL TABLE IF NOT EXISTS {index} USING fts5(
+        title, description,
+        content='auctions_listing', content_rowid='id',
+        tokenize='unicode61 remove_diacritics 2', prefix='2 3'
+    )
+"""
+
+
+def fts_triggers(index, copied=None):
+    """The triggers keeping `index` in step with auctions_listing.
+
+    With `copied`, an SQL expression, only for the listings whose id is at
+    most its value: the ones a batched rebuild has already copied over.
+    """
+    def when(row):
+        return f"WHEN {row}.id <= ({copied}) " if copied else ""
+    return {
+        f"{index}_insert": f"""
+        AFTER INSERT ON auctions_listing {when('new')}BEGIN
+            INSERT INTO {index}(rowid, title, description)
+            VALUES (new.id, new.title, new.description);
+        END
+    """,
+        f"{index}_delete": f"""
+        AFTER DELETE ON auctions_listing {when('old')}BEGIN
+            INSERT INTO {index}({index}, rowid, title, description)
+            VALUES ('delete', old.id, old.title, old.description);
+        END
+    """,
+        f"{index}_update": f"""
+        AFTER UPDATE OF title, description ON auctions_listing {when('old')}BEGIN
+            INSERT INTO {index}({index}, rowid, title, description)
+            VALUES ('delete', old.id, old.title, old.description);
+            INSERT INTO {index}(rowid, title, description)
+            VALUES (new.id, new.title, new.description);
+        END
+    """,
+    }
+
+
+FTS_TRIGGERS = fts_triggers(FTS_INDEX)
+
+LATEST_DATE = "(SELECT MAX(date) FROM auctions_listing WHERE category_id = {0}.category_id)"
+
+CATEGORY_COUNT_TRIGGERS = {
+    "auctions_category_counts_insert": """
+        AFTER INSERT ON auctions_listing BEGIN
+            UPDATE auctions_category SET
+                total_count = total_count + 1,
+                active_count = active_count + new.on_sell,
+                latest_date = CASE WHEN latest_date IS NULL OR new.date > latest_date
+                                   THEN new.date ELSE latest_date END
+            WHERE id = new.category_id;
+        END
+    """,
+    "auctions_category_counts_delete": f"""
+        AFTER DELETE ON auctions_listing BEGIN
+            UPDATE auctions_category SET
+                total_count = total_count - 1,
+                active_count = active_count - old.on_sell,
+                latest_date = {LATEST_DATE.format('old')}
+            WHERE id = old.category_id;
+        END
+    """,
+    "auctions_category_counts_sell": """
+        AFTER UPDATE OF on_sell ON auctions_listing
+        WHEN old.category_id IS new.category_id AND old.on_sell IS NOT new.on_sell BEGIN
+            UPDATE auctions_category SET active_count = active_count + new.on_sell - old.on_sell
+            WHERE id = new.category_id;
+        END
+    """,
+    "auctions_category_counts_move": f"""
+        AFTER UPDATE OF category_id ON auctions_listing
+        WHEN old.category_id IS NOT new.category_id BEGIN
+            UPDATE auctions_category SET
+                total_count = total_count - 1,
+                active_count = active_count - old.on_sell,
+                latest_date = {LATEST_DATE.format('old')}
+            WHERE id = old.category_id;
+            UPDATE auctions_category SET
+                total_count = total_count + 1,
+                active_count = active_count + new.on_sell,
+                latest_date = {LATEST_DATE.format('new')}
+            WHERE id = new.category_id;
+        END
+    """,
+    "auctions_category_counts_date": f"""
+        AFTER UPDATE OF date ON auctions_listing
+        WHEN old.category_id IS new.category_id AND old.date IS NOT new.date BEGIN
+            UPDATE auctions_category SET latest_date = {LATEST_DATE.format('new')}
+            WHERE id = new.category_id;
+        END
+    """,
+}
+
+# Written the way Django stores datetimes on SQLite (UTC, microseconds), so
+# stamped and ORM-written values compare correctly as text
+TOUCH_TRIGGERS = {
+    "auctions_listing_touch": """
+        AFTER UPDATE ON auctions_listing WHEN new.updated_at IS old.updated_at BEGIN
+            UPDATE auctions_listing SET updated_at = strftime('%Y-%m-%d %H:%M:%f000', 'now')
+            WHERE id = new.id;
+        END
+    """,
+}
+
+COMMENT_COUNT_TRIGGERS = {
+    "auctions_comment_count_insert": """
+        AFTER INSERT ON auctions_comment BEGIN
+            UPDATE auctions_listing SET comment_count = comment_count + 1 WHERE id = new.item_id;
+        END
+    """,
+    "auctions_comment_count_delete": """
+        AFTER DELETE ON auctions_comment BEGIN
+            UPDATE auctions_listing SET comment_count = comment_count - 1 WHERE id = old.item_id;
+        END
+    """,
+}
+
+# Written like the touch trigger's stamp. INSERT OR REPLACE drops the
+# listing's previous row, so each listing has one, with its last change
+CHANGE_LOG = """
+    INSERT OR REPLACE INTO auctions_listingchange (listing_id, deleted, changed_at)
+    VALUES ({0}.id, {1}, strftime('%Y-%m-%d %H:%M:%f000', 'now'));
+"""
+
+CHANGE_LOG_TRIGGERS = {
+    "auctions_listing_change_insert": f"""
+        AFTER INSERT ON auctions_listing BEGIN {CHANGE_LOG.format('new', 0)} END
+    """,
+    "auctions_listing_change_update": f"""
+        AFTER UPDATE ON auctions_listing BEGIN {CHANGE_LOG.format('new', 0)} END
+    """,
+    "auctions_listing_change_delete": f"""
+        AFTER DELETE ON auctions_listing BEGIN {CHANGE_LOG.format('old', 1)} END
+    """,
+}
@@ -1,5 +1,5 @@
 from django.urls import path
-from . import views
+from . import api, metrics, throttling, views
 
 urlpatterns = [
     path("", views.index, name="index"),
@@ -9,11 +9,22 @@ urlpatterns = [
     path("create", views.create, name="create"),
     path("all", views.all, name="all"),
     path("listing/<str:item_id>", views.details, name="details"),
+    path("listing/<str:item_id>/events", views.listing_events, name="listing_events"),
     path("watchlist/add/<str:item_id>", views.add, name="add"),
     path("watchlist/remove/<str:item_id>", views.remove, name="remove"),
     path("watchlist/", views.watchlist, name="watchlist"),
     path("listing/sell/<str:item_id>", views.sell, name="sell"),
     path("listing/comment/<str:item_id>", views.add_comment, name="add_comment"),
+    path("listing/<str:item_id>/comments", views.comments, name="comments"),
     path("category", views.category, name="category"),
-    path("category/<str:category_id>", views.search, name="searchCategory")
+    path("category/<int:category_id>", views.search, name="searchCategory"),
+    path("search", views.text_search, name="search"),
+    path("api/listings", api.listing_list, name="api_listings"),
+    path("api/listings/changes", api.changes, name="api_changes"),
+    path("api/listings/export", api.export, name="api_export"),
+    path("api/listings/<int:item_id>", api.listing_detail, name="api_listing"),
+    path("api/listings/<int:item_id>/bids", api.listing_bids, name="api_bids"),
+    path("api/categories", api.category_list, name="api_categories"),
+    path("throttle", throttling.stats, name="throttle_stats"),
+    path("metrics", metrics.metrics, name="metrics"),
 ]
@@ -1,14 +1,29 @@
 import datetime
+import json
 
 from django import forms
 from django.contrib.auth import authenticate, login, logout
 from django.contrib.auth.decorators import login_required
 from django.db import IntegrityError
-from django.http import HttpResponse, HttpResponseRedirect
-from django.shortcuts import render
+from django.http import Http404, HttpResponse, HttpResponseRedirect, JsonResponse
+from django.shortcuts import get_object_or_404, render
+from django.template.loader import render_to_string
 from django.urls import reverse
-
-from .models import Listing, User, Category, Bid, Watchlist, Comment
+from django.utils import timezone
+
+from .bidding import BidRejected, place_bid
+from .categories import choices as category_choices, registry as categories
+from .detail import ListingDetail, comment_page
+from .generations import ALL, CATEGORIES, ON_SELL, category_feed, listing_page
+from .closing import close_listings
+from .conditional import feed_etag, listing_etag, listing_last_modified, remember_listing, revalidate
+from .live import bid_event, closed_event, publish
+from .pagecache import anonymous_page
+from .models import Category, Listing, User, Watchlist, Comment
+from .pagination import keyset_page
+from .routers import read_only
+from .search import search_listings
+from .thumbnails import schedule_thumbnails
 
 # pylint: disable=no-member
 
@@ -17,12 +32,14 @@ class ListingForm(forms.Form):
     description = forms.CharField(label='', max_length=450, widget=forms.Textarea(attrs={'placeholder': 'Description (450 character maximum)', 'maxlenght':'450', 'cols':'32'}))
     price = forms.DecimalField(label='PRICE', required=True, widget=forms.TextInput(attrs={'placeholder': 'Price in EUR'}))
     image = forms.ImageField()
-    choice = forms.ChoiceField(choices = [])
-
-    #To take Category by Model
-    def __init__(self, *args, **kwargs):
-        super(ListingForm, self).__init__(*args, **kwargs)
-        self.fields['choice'].choices = [(x.pk, x.name) for x in Category.objects.all()]
+    # Called on each render and validation, answered from memory
+    choice = forms.ChoiceField(choices = category_choices)
+    duration = forms.TypedChoiceField(label='', required=False, coerce=int, empty_value=None, choices = [
+        ('', 'No end date, close it myself'),
+        (1, 'Ends in 1 day'),
+        (3, 'Ends in 3 days'),
+        (7, 'Ends in 7 days'),
+    ])
 
 class Bids(forms.Form):
     bid = forms.DecimalField(label='',required=False, widget=forms.TextInput(attrs={'placeholder': 'Place a bid'}))
@@ -30,9 +47,18 @@ class Bids(forms.Form):
 class CommentForm(forms.Form):
     comment = forms.CharField(label='', required=False, max_length=250, widget=forms.Textarea(attrs={'placeholder': 'Leave a comment (250 character maximum)', 'rows':'15', 'cols':'32','maxlenght':250}))
 
+def feed(queryset):
+    return queryset.select_related("owner", "category")
+
+
+@read_only
+@anonymous_page(ON_SELL)
+@revalidate(feed_etag(ON_SELL))
 def index(request):
+    items, next_cursor = keyset_page(feed(Listing.objects.filter(on_sell=True)), request.GET.get("after"))
     return render(request, "auctions/index.html", {
-            "items": Listing.objects.exclude(on_sell=False),
+            "items": items,
+            "next_cursor": next_cursor,
             "all": False
         })
 
@@ -103,132 +129,88 @@ def create(request):
             price = requestForm.cleaned_data.get("price")
             image = requestForm.cleaned_data.get("image")
             id_category = requestForm.cleaned_data.get("choice")
+            duration = requestForm.cleaned_data.get("duration")
+            now = timezone.now()
             item = Listing.objects.create(
                                  title = title,
                                  description = description,
                                  price = price,
                                  image = image,
-                                 category = Category.objects.get(id=id_category),
-                                 owner = User.objects.get(username=request.user.get_username()),
-                                 date=datetime.datetime.now()
+                                 category_id = int(id_category),
+                                 owner = request.user,
+                                 date=now,
+                                 ends_at=now + datetime.timedelta(days=duration) if duration else None
                                  )
-            item.save()
+            schedule_thumbnails(item)
             return HttpResponseRedirect(reverse("index"))
-    else: 
-        return render(request, "auctions/create.html", {
-            "form": ListingForm()
-        })
+    else:
+        requestForm = ListingForm()
+    return render(request, "auctions/create.html", {
+        "form": requestForm
+    })
 
 
+@anonymous_page(listing_page)
+@revalidate(listing_etag, listing_last_modified, recorded=True)
 def details(request, item_id):
     user = request.user
-    item = Listing.objects.get(pk=item_id)
-    if not user.is_authenticated:
-        return render(request, "auctions/item.html", {
-            "item": Listing.objects.get(id=item_id),
-            "logged": False,
-            "comments": Comment.objects.filter(item_id=item_id),
-            "bid": Bid.objects.filter(item = item).last(),
-        })
-    
-    #IF USER IS AUTENTICATED
-    else:
-        
+    message = None
+    if request.method == "POST" and user.is_authenticated:
         form = Bids(request.POST)
-
-        if Watchlist.objects.filter(user=user).filter(item=item).exists():
-            present = True
-        else:
-            present = False
-
-        context = { "logged": True,
-                    "item": Listing.objects.get(pk = item_id),
-                    "bid_form": Bids,
-                    "bid": Bid.objects.filter(item = item).last(),
-                    "owner": False,
-                    "present": present,
-                    "comment_form": CommentForm(),
-                    "comments": Comment.objects.filter(item_id=item_id)
-                    }
-        
-        if request.method == "POST" and form.is_valid():
-            offer = form.cleaned_data.get('bid')
-            if item.actual_bid < offer and item.price < offer:
-                    new_bid = Bid.objects.create(
-                        amount= offer,
-                        buyer = request.user,
-                        item = item
-                    )
-                    new_bid.save()
-                    item.actual_bid = offer
-                    item.save()
-                    return HttpResponseRedirect(reverse("details", args=(item.id,)))               
-            else:
-                    return render(request, "auctions/item.html",
-                    { 
-                    "message": str(offer) + " € ISN'T ENOUGH!",
-                    "logged": True,
-                    "item": Listing.objects.get(pk = item_id),
-                    "bid_form": Bids,
-                    "bid": Bid.objects.filter(item = item).last(),
-                    "present": present
-                    })
-            #METHOD GET
-        else:
-            
-            if item.actual_bid != 0.0:
-                if user != item.owner:
-                    return render(request, "auctions/item.html", context)
-                else:
-                    return render(request, "auctions/item.html", {
-                       "logged": True,
-                        "item": Listing.objects.get(pk = item_id),
-                        "bid": Bid.objects.filter(item = item).last(),
-                        "owner": True,
-                        "present": present,
-                        "comment_form": CommentForm(),
-                        "comments": Comment.objects.filter(item_id=item_id)
-                    })
-                            
-            else:
-                if user != item.owner:
-                    return render(request, "auctions/item.html", {
-                        "logged": True,
-                        "item": Listing.objects.get(id=item_id),
-                        "bid_form": Bids,
-                        "bid.amount": 0,
-                        "owner": False,
-                        "present": present,
-                        "comment_form": CommentForm(),
-                        "comments": Comment.objects.filter(item_id=item_id)
-                    })
-                else:
-                    return render(request, "auctions/item.html", {
-                        "logged": True,
-                        "item": Listing.objects.get(id=item_id),
-                        "bid.amount": 0,
-                        "owner": True,
-                        "present": present,
-                        "comment_form": CommentForm(),
-                        "comments": Comment.objects.filter(item_id=item_id)
-                    })
+        if form.is_valid():
+            try:
+                place_bid(item_id, user, form.cleaned_data.get('bid'))
+                return HttpResponseRedirect(reverse("details", args=(item_id,)))
+            except BidRejected as rejected:
+                message = str(rejected)
+
+    detail = ListingDetail.load(item_id, user)
+    remember_listing(request, detail.item)
+    owner = detail.is_owner(user)
+    context = {
+        "logged": user.is_authenticated,
+        "item": detail.item,
+        "owner": owner,
+        "present": detail.item.watched,
+        "comments": detail.comments,
+        "next_comments": detail.next_comments,
+        "message": message,
+    }
+    if user.is_authenticated:
+        context["comment_form"] = CommentForm()
+        if not owner:
+            context["bid_form"] = Bids()
+    return render(request, "auctions/item.html", context)
+
+@read_only
+def listing_events(request, item_id):
+    # Under ASGI commerce/asgi.py streams this URL live. Served by WSGI it
+    # answers the current state once and the browser asks again after
+    # `retry` milliseconds.
+    state = Listing.objects.filter(pk=item_id).values("actual_bid", "on_sell", "leading_bidder__username").first()
+    if state is None:
+        raise Http404
+    if state["on_sell"]:
+        event = bid_event(item_id, state["actual_bid"], state["leading_bidder__username"] or "")
+    else:
+        event = closed_event(item_id)
+    return HttpResponse(f"retry: 5000\ndata: {json.dumps(event)}\n\n", content_type="text/event-stream")
 
 @login_required
 def add(request, item_id):
     if request.method == "GET":
         item = Listing.objects.get(pk=item_id)
-        owner = User.objects.get(username=request.user.get_username())
-        new_item = Watchlist.objects.create(
+        Watchlist.objects.get_or_create(
                 item = item,
-                user = owner
+                user = request.user
             )
-        new_item.save()
         return HttpResponseRedirect(reverse("details", args=(item.id,)))
 
 @login_required
+@read_only
 def watchlist(request):
     if request.method == "GET":
-        items = Watchlist.objects.filter(user = request.user)
+        items = Watchlist.objects.filter(user = request.user).select_related("item__owner", "item__category")
         return render(request, "auctions/watchlist.html", {
             "items": items
         }) 
@@ -237,51 +219,101 @@ def watchlist(request):
 def remove(request, item_id):
     if request.method == "GET":
         item = Listing.objects.get(pk=item_id)
-        removed = Watchlist.objects.filter(item=item).delete()
+        removed = Watchlist.objects.filter(user=request.user, item=item).delete()
         return HttpResponseRedirect(reverse("details", args=(item.id,)))
 
 @login_required
 def sell(request, item_id):
     if request.method == "GET":
-        item = Listing.objects.get(pk=item_id)
-        item.on_sell=False
-        item.save(update_fields=['on_sell'])
-        return HttpResponseRedirect(reverse("details", args=(item.id,)))
+        if close_listings(Listing.objects.filter(pk=item_id, owner=request.user)):
+            publish(closed_event(item_id))
+        return HttpResponseRedirect(reverse("details", args=(item_id,)))
 
 
+@read_only
+@anonymous_page(ALL)
+@revalidate(feed_etag(ALL))
 def all(request):
     if request.method == "GET":
+        items, next_cursor = keyset_page(feed(Listing.objects.all()), request.GET.get("after"))
         return render(request, "auctions/index.html", {
-            "items": Listing.objects.all(),
+            "items": items,
+            "next_cursor": next_cursor,
             "all": True
         })
 
 
+@login_required
 def add_comment(request, item_id):
     form = CommentForm(request.POST)
     if request.method == "POST" and form.is_valid():
+        # The listing's comment_count is raised by a trigger
         new_comment = Comment.objects.create(
             description= form.cleaned_data.get('comment'),
-            date = datetime.datetime.now(),
+            date = timezone.now(),
             user = request.user,
-            item = Listing.objects.get(pk=item_id)
+            item = get_object_or_404(Listing.objects.only("id"), pk=item_id)
         )
-        new_comment.save()
-        return HttpResponseRedirect(reverse("details", args=(item_id,)))
+        if "application/json" in request.headers.get("Accept", ""):
+            # The page puts it on top of its list itself
+            return JsonResponse({
+                "html": render_to_string("auctions/comments.html", {"comments": [new_comment]}, request),
+            }, status=201)
+    return HttpResponseRedirect(reverse("details", args=(item_id,)))
+
+@read_only
+def comments(request, item_id):
+    page, next_cursor = comment_page(item_id, request.GET.get("after"))
+    return JsonResponse({
+        "html": render_to_string("auctions/comments.html", {"comments": page}, request),
+        "next": next_cursor,
+    })
         
+@read_only
+@revalidate(feed_etag(CATEGORIES))
 def category(request):
     if request.method == "GET":
+        # The rows, for the counts the triggers keep
         return render(request, "auctions/category.html",{
             "categories": Category.objects.all(),
             "all": True
         })
 
 
+@read_only
+@anonymous_page(category_feed)
+@revalidate(feed_etag(category_feed))
 def search(request, category_id):
     if request.method == "GET":
+        items, next_cursor = keyset_page(
+            feed(Listing.objects.filter(category=category_id, on_sell=True)),
+            request.GET.get("after"))
         return render(request, "auctions/category.html",{
-            "item": Category.objects.all().filter(pk=category_id).first(),
-            "categories": Listing.objects.filter(category=category_id).exclude(on_sell=False),
+            "item": Category.objects.filter(pk=category_id).first(),
+            "categories": items,
+            "next_cursor": next_cursor,
             "all": False
         }) 
    
+
+
+@read_only
+def text_search(request):
+    query = request.GET.get("q", "")
+    category_id = request.GET.get("category", "")
+    category_id = int(category_id) if category_id.isdigit() else None
+    on_sell = None if request.GET.get("closed") else True
+    items, next_cursor = search_listings(query, category_id, on_sell, request.GET.get("after"))
+    next_page = None
+    if next_cursor:
+        next_page = request.GET.copy()
+        next_page["after"] = next_cursor
+        next_page = next_page.urlencode()
+    return render(request, "auctions/search.html", {
+        "query": query,
+        "category_id": category_id,
+        "closed": on_sell is None,
+        "categories": categories.all(),
+        "items": items,
+        "next_page": next_page,
+    })
@@ -3,14 +3,48 @@ ASGI config for commerce project.
 
 It exposes the ASGI callable as a module-level variable named ``application``.
 
+Live bid streams (/listing/<id>/events) are answered here directly, without
+going through Django's request cycle, so an idle subscriber costs only its
+coroutine and queue. Everything else is passed to Django, which resolves
+it against commerce/asgi_urls.py: the async pages first, then the regular
+URLconf. Run it with any ASGI server, e.g.
+
+    uvicorn commerce.asgi:application --workers 4
+
 For more information on this file, see
 https://docs.djangoproject.com/en/3.0/howto/deployment/asgi/
 """
 
 import os
+import re
 
-from django.core.asgi import get_asgi_application
+import django
+from django.core.handlers.asgi import ASGIHandler, ASGIRequest
 
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'commerce.settings')
 
-application = get_asgi_application()
+
+class AsyncPagesRequest(ASGIRequest):
+    # Read by the URL resolver in place of ROOT_URLCONF
+    urlconf = 'commerce.asgi_urls'
+
+
+class AsyncPagesHandler(ASGIHandler):
+    request_class = AsyncPagesRequest
+
+
+# What get_asgi_application() does, with the handler above
+django.setup(set_prefix=False)
+django_application = AsyncPagesHandler()
+
+from auctions.live import listing_events  # noqa: E402  needs settings configured
+
+LISTING_EVENTS = re.compile(r'^/listing/(?P<item_id>\d+)/events$')
+
+
+async def application(scope, receive, send):
+    if scope['type'] == 'http' and scope['method'] == 'GET':
+        match = LISTING_EVENTS.match(scope['path'])
+        if match:
+            return await listing_events(scope, receive, send, int(match['item_id']))
+    return await django_application(scope, receive, send)
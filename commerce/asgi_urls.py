@@ -0,0 +1,19 @@
+"""URLconf of the ASGI deployment (commerce/asgi.py).
+
+The read-heavy pages are answered by the async views in
+auctions/async_views.py; the same paths and names follow in
+commerce/urls.py for everything else, so reverse() is unchanged.
+"""
+from django.urls import path
+
+from auctions import async_views
+from . import urls
+
+urlpatterns = [
+    path("", async_views.index, name="index"),
+    path("all", async_views.all, name="all"),
+    path("listing/<str:item_id>", async_views.details, name="details"),
+    path("watchlist/", async_views.watchlist, name="watchlist"),
+    path("category", async_views.category, name="category"),
+    path("category/<int:category_id>", async_views.search, name="searchCategory"),
+] + urls.urlpatterns
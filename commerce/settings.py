@@ -31,7 +31,7 @@ ALLOWED_HOSTS = []
 # Application definition
 
 INSTALLED_APPS = [
-    'auctions',
+    'auctions.apps.AuctionsConfig',
     'django.contrib.admin',
     'django.contrib.auth',
     'django.contrib.contenttypes',
@@ -41,11 +41,13 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    'auctions.metrics.MetricsMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
     'django.middleware.csrf.CsrfViewMiddleware',
     'django.contrib.auth.middleware.AuthenticationMiddleware',
+    'auctions.throttling.ThrottleMiddleware',
     'django.contrib.messages.middleware.MessageMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
 ]
@@ -54,7 +56,8 @@ ROOT_URLCONF = 'commerce.urls'
 
 TEMPLATES = [
     {
-        'BACKEND': 'django.template.backends.django.DjangoTemplates',
+        # DjangoTemplates that reports render time to auctions.metrics
+        'BACKEND': 'auctions.metrics.TimedDjangoTemplates',
         'DIRS': [],
         'APP_DIRS': True,
         'OPTIONS': {
@@ -74,15 +77,128 @@ WSGI_APPLICATION = 'commerce.wsgi.application'
 # Database
 # https://docs.djangoproject.com/en/3.0/ref/settings/#databases
 
+#
+# commerce.sqlite is the stock backend plus PRAGMAS run on connect and
+# BEGIN IMMEDIATE transactions, see commerce/sqlite/base.py. Pages that only
+# read use the "read" alias on the same file (auctions/routers.py).
+# manage.py db_benchmark compares this profile with the plain backend.
+
+SQLITE_PRAGMAS = {
+    # Readers no longer block the writer and the other way round
+    'journal_mode': 'WAL',
+    # fsync at checkpoints only; safe from corruption in WAL mode, a power
+    # cut may lose the last commits
+    'synchronous': 'NORMAL',
+    # Milliseconds a writer waits for the lock before "database is locked"
+    'busy_timeout': 5000,
+    'mmap_size': 256 * 1024 * 1024,
+    # Negative means KiB: 64 MB of page cache per connection
+    'cache_size': -64000,
+    'temp_store': 'MEMORY',
+}
+
 DATABASES = {
     'default': {
-        'ENGINE': 'django.db.backends.sqlite3',
+        'ENGINE': 'commerce.sqlite',
         'NAME': os.path.join(BASE_DIR, 'db.sqlite3'),
-    }
+        'CONN_MAX_AGE': 600,
+        'PRAGMAS': SQLITE_PRAGMAS,
+        'TRANSACTION_MODE': 'IMMEDIATE',
+    },
+    'read': {
+        'ENGINE': 'commerce.sqlite',
+        'NAME': os.path.join(BASE_DIR, 'db.sqlite3'),
+        'CONN_MAX_AGE': 600,
+        'PRAGMAS': {**SQLITE_PRAGMAS, 'query_only': 'ON'},
+        'TEST': {'MIRROR': 'default'},
+    },
 }
 
+DATABASE_ROUTERS = ['auctions.routers.ReadRouter']
+
 AUTH_USER_MODEL = 'auctions.User'
 
+# request.user is read from the "sessions" cache, see auctions/auth.py
+AUTHENTICATION_BACKENDS = ['auctions.auth.CachedModelBackend']
+
+# Sessions are read from the "sessions" cache and written through to the
+# database, so a culled cache entry only costs a query, not a logout
+SESSION_ENGINE = 'django.contrib.sessions.backends.cached_db'
+SESSION_CACHE_ALIAS = 'sessions'
+
+# Cache
+# https://docs.djangoproject.com/en/3.0/topics/cache/
+#
+# Rendered listing cards go to "template_fragments". It has to be shared by
+# every worker process, so it lives on disk (or use DatabaseCache).
+
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+    },
+    'template_fragments': {
+        'BACKEND': 'django.core.cache.backends.filebased.FileBasedCache',
+        'LOCATION': os.path.join(BASE_DIR, 'cache', 'fragments'),
+        'TIMEOUT': 60 * 60 * 24,
+        'OPTIONS': {
+            'MAX_ENTRIES': 10000,
+        },
+    },
+    # Sessions and logged in users. Shared by every worker like the
+    # fragments, or a logout in one would not be seen by the others
+    'sessions': {
+        'BACKEND': 'django.core.cache.backends.filebased.FileBasedCache',
+        'LOCATION': os.path.join(BASE_DIR, 'cache', 'sessions'),
+        'TIMEOUT': 60 * 60 * 24 * 14,
+        'OPTIONS': {
+            'MAX_ENTRIES': 100000,
+        },
+    },
+    # Whole pages for anonymous visitors (auctions/pagecache.py) and the
+    # generation tokens of the pages and their ETags (auctions/generations.py)
+    'pages': {
+        'BACKEND': 'django.core.cache.backends.filebased.FileBasedCache',
+        'LOCATION': os.path.join(BASE_DIR, 'cache', 'pages'),
+        'TIMEOUT': 60 * 5,
+        'OPTIONS': {
+            'MAX_ENTRIES': 20000,
+        },
+    },
+}
+
+# Admission control of the write endpoints, see auctions/throttling.py
+
+# "memory" (per process) or "cache" (the THROTTLE_CACHE alias, shared;
+# memcached, local memory, or file based counted under a lock file)
+THROTTLE_BACKEND = 'memory'
+THROTTLE_CACHE = 'sessions'
+
+# URL name: (methods, tokens per second, burst), per user or IP
+THROTTLE_RATES = {
+    'details': (('POST',), 1, 5),
+    'add': (('GET',), 0.5, 10),
+    'remove': (('GET',), 0.5, 10),
+    'add_comment': (('POST',), 0.2, 5),
+    'sell': (('GET',), 0.2, 5),
+    'create': (('POST',), 0.05, 5),
+}
+
+# Requests to those routes running at once in one process, past which
+# they are answered 503 rather than queued on the SQLite write lock
+THROTTLE_MAX_WRITES = 16
+
+# In-memory category names, see auctions/categories.py; where the version
+# token lives, shared by the workers
+CATEGORY_CACHE = 'sessions'
+
+# Request metrics, see auctions/metrics.py
+
+# Requests slower than this are logged with their slowest queries
+SLOW_REQUEST_SECONDS = 0.5
+
+# Clients allowed to read /metrics
+METRICS_ALLOWED_IPS = ('127.0.0.1', '::1')
+
 # Password validation
 # https://docs.djangoproject.com/en/3.0/ref/settings/#auth-password-validators
 
@@ -121,13 +237,46 @@ USE_TZ = True
 
 STATIC_URL = '/static/'
 
-STATICFILES_DIRS = (
-    os.path.join(BASE_DIR, "static"),
-)
+# collectstatic copies the files here under hashed names, each with gzip
+# (and, when the brotli package is installed, brotli) copies next to it;
+# commerce/urls.py serves them, and the uploads, from this process
+STATIC_ROOT = os.path.join(BASE_DIR, "staticfiles")
+
+STATICFILES_STORAGE = 'auctions.storage.CompressedManifestStaticFilesStorage'
 
 MEDIA_ROOT = (
 BASE_DIR
 )
 
 
-MEDIA_URL = '/items/'
\ No newline at end of file
+MEDIA_URL = '/items/'
+
+# Number of listings shown per page in the feeds (index, all, category)
+LISTINGS_PAGE_SIZE = 24
+
+# Number of comments rendered with the listing page
+COMMENTS_PAGE_SIZE = 20
+
+# Number of bids per page of a listing's bid history
+BIDS_PAGE_SIZE = 20
+
+# Listing images: widths of the resized copies (each also saved as WebP)
+# written next to every upload, and the worker processes that make them.
+# 0 workers makes them inline during the request.
+THUMBNAIL_WIDTHS = (320, 640, 1024)
+THUMBNAIL_WORKERS = 2
+
+# Live bid streams (commerce/asgi.py). When set, every ASGI worker binds a
+# unix socket in this directory and bids taken by any worker are sent to
+# all of them. None keeps events inside the process that took the bid.
+LIVE_EVENTS_DIR = None
+
+# Anonymous page cache (auctions/pagecache.py): how long a page is kept
+# at most, and how long a request waits for another one rendering it
+PAGE_CACHE = 'pages'
+PAGE_CACHE_SECONDS = 60 * 5
+PAGE_CACHE_WAIT = 2
+
+# Threads rendering the async pages of the ASGI deployment, see
+# auctions/async_views.py
+ASYNC_VIEW_THREADS = 8
@@ -0,0 +1,25 @@
+"""SQLite backend tuned for several processes reading and writing at once.
+
+Same as django.db.backends.sqlite3 plus two keys in the DATABASES entry:
+
+- PRAGMAS: {name: value} run on every new connection, see SQLITE_PRAGMAS
+  in settings.py.
+- TRANSACTION_MODE: "IMMEDIATE" takes the write lock when an atomic block
+  begins. With the default deferred BEGIN a transaction that has read
+  something and then writes can fail with "database is locked" straight
+  away instead of waiting busy_timeout for the other writer.
+"""
+from django.db.backends.sqlite3 import base
+
+
+class DatabaseWrapper(base.DatabaseWrapper):
+
+    def get_new_connection(self, conn_params):
+        connection = super().get_new_connection(conn_params)
+        for name, value in self.settings_dict.get("PRAGMAS", {}).items():
+            connection.execute(f"PRAGMA {name} = {value}")
+        return connection
+
+    def _start_transaction_under_autocommit(self):
+        mode = self.settings_dict.get("TRANSACTION_MODE")
+        self.cursor().execute(f"BEGIN {mode}" if mode else "BEGIN")
@@ -13,16 +13,26 @@ Including another URLconf
     1. Import the include() function: from django.urls import include, path
     2. Add a URL to urlpatterns:  path('blog/', include('blog.urls'))
 """
+import os
+import re
+
 from django.contrib import admin
-from django.urls import include, path
-from django.contrib.staticfiles.urls import static
-from django.contrib.staticfiles.urls import staticfiles_urlpatterns
+from django.urls import include, path, re_path
+from auctions.storage import CONTENT_ADDRESSED_NAME, STATIC_HASHED_NAME, serve_file
 from . import settings
 
+
+def files(prefix, document_root, immutable):
+    return re_path(rf"^{re.escape(prefix.lstrip('/'))}(?P<path>.*)$", serve_file,
+                   {"document_root": document_root, "immutable": immutable})
+
+
+# Static files and uploads are served by the app itself in every setting;
+# under DEBUG runserver answers /static/ from the app directories first.
+# MEDIA_ROOT is the project directory, so only its upload directory is.
 urlpatterns = [
     path("admin/", admin.site.urls),
+    files(settings.STATIC_URL, settings.STATIC_ROOT, STATIC_HASHED_NAME),
+    files(settings.MEDIA_URL + "items/", os.path.join(settings.MEDIA_ROOT, "items"), CONTENT_ADDRESSED_NAME),
     path("", include("auctions.urls"))
 ]
-
-if settings.DEBUG:
-    urlpatterns = urlpatterns + static(settings.MEDIA_URL, document_root=settings.MEDIA_ROOT) 
\ No newline at end of file